@@ -0,0 +1,104 @@
+"""Priority lanes for the single serial worker.
+
+Every bus transaction runs on one worker thread fed by ``LaneTaskQueue``.
+This module only depends on the standard library.
+"""
+
+import collections
+import threading
+
+LANE_INTERACTIVE = 0  # Read / Write ボタン
+LANE_POLL = 1         # 周期ポーリング・TCP ゲートウェイ
+LANE_BULK = 2         # シーケンス実行（1 ステップ 1 タスク）
+LANE_NAMES = ("interactive", "poll", "bulk")
+
+DEFAULT_STARVE_LIMIT = 4  # 下位レーンが連続して後回しにされてよい回数
+
+
+class LaneTaskQueue:
+    """Task queue with priority lanes.
+
+    The interactive lane always goes first. Below it, lanes are served in
+    order, except that a waiting lane passed over ``starve_limit`` times in
+    a row gets the next turn; a poll set that refills faster than it drains
+    therefore cannot starve the bulk lane.
+
+    Items put with a ``key`` replace a still-pending item with the same key
+    in place, so a stale duplicate (e.g. an older poll of the same register)
+    is dropped instead of being sent on the bus. Mirrors the ``queue.Queue``
+    methods the worker uses (``get``/``task_done``/``qsize``/``join``).
+    """
+
+    def __init__(self, starve_limit=DEFAULT_STARVE_LIMIT):
+        self._lanes = tuple(collections.deque() for _ in LANE_NAMES)
+        self._passed = [0] * len(LANE_NAMES)
+        self._starve_limit = starve_limit
+        self._pending = {}
+        self._unfinished = 0
+        self._dropped = 0
+        self._cond = threading.Condition()
+
+    def put(self, item, lane=LANE_INTERACTIVE, key=None):
+        with self._cond:
+            if key is not None:
+                slot = self._pending.get(key)
+                if slot is not None:
+                    slot[0] = item
+                    self._dropped += 1
+                    return
+                slot = [item, key]
+                self._pending[key] = slot
+            else:
+                slot = [item, None]
+            self._lanes[lane].append(slot)
+            self._unfinished += 1
+            self._cond.notify()
+
+    def get(self):
+        with self._cond:
+            while True:
+                lane = self._next_lane()
+                if lane is not None:
+                    item, key = self._lanes[lane].popleft()
+                    if key is not None:
+                        del self._pending[key]
+                    return item
+                self._cond.wait()
+
+    def _next_lane(self):
+        waiting = [lane for lane, items in enumerate(self._lanes) if items]
+        if not waiting:
+            return None
+        chosen = waiting[0]
+        if chosen != LANE_INTERACTIVE:
+            for lane in waiting[1:]:
+                if self._passed[lane] >= self._starve_limit:
+                    chosen = lane
+                    break
+        for lane in waiting:
+            if lane > chosen:
+                self._passed[lane] += 1
+        self._passed[chosen] = 0
+        return chosen
+
+    def task_done(self):
+        with self._cond:
+            self._unfinished -= 1
+            if self._unfinished <= 0:
+                self._cond.notify_all()
+
+    def join(self):
+        with self._cond:
+            while self._unfinished > 0:
+                self._cond.wait()
+
+    def qsize(self, lane=None):
+        with self._cond:
+            if lane is None:
+                return sum(len(q) for q in self._lanes)
+            return len(self._lanes[lane])
+
+    @property
+    def dropped(self):
+        """Number of pending items superseded by a newer item with the same key."""
+        return self._dropped
@@ -3,16 +3,27 @@ from tkinter import ttk, scrolledtext, messagebox, filedialog
 import serial
 import serial.tools.list_ports
 import struct
+import contextlib
 import threading
-import queue
 import sys
+import time
+import argparse
+import json
 import pandas as pd
 import os
 from importlib import resources as importlib_resources
+from modbus_master_sim.lanes import LANE_BULK, LANE_INTERACTIVE, LANE_NAMES, LANE_POLL, LaneTaskQueue
+from modbus_master_sim.register_search import RegisterIndex
+from modbus_master_sim.shared_image import DEFAULT_NAME as SHM_DEFAULT_NAME, SharedPollImage
+from modbus_master_sim.sequence import SequenceError, SequenceRunner, compile_sequence, load_sequence
+from modbus_master_sim import tcp_gateway as gateway_mod
 
 # --- 通信用キューとスレッド ---
-serial_task_queue = queue.Queue()
+serial_task_queue = LaneTaskQueue()
 root = None  # Late-initialized Tk root shared across callbacks
+poll_image = None  # Optional SharedPollImage receiving decoded polling results
+bus_cache = None  # Optional RegisterCache fed by every successful FC03 read
+tcp_gateway = None  # Optional ModbusTcpGateway serving bus_cache to TCP clients
 
 def serial_worker():
     while True:
@@ -24,7 +35,166 @@ def serial_worker():
         finally:
             serial_task_queue.task_done()
 
-threading.Thread(target=serial_worker, daemon=True).start()
+threading.Thread(target=serial_worker, name="serial_worker", daemon=True).start()
+
+
+# --- 性能計測（--perf 指定時のみ有効） ---
+class PerfMonitor:
+    """Opt-in stage timers, Tk main-loop lag heartbeat and queue-depth gauge.
+
+    When disabled every hook is a no-op, so instrumented code paths cost
+    nothing in normal runs.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self._stages = {}
+        self._lag = [0, 0.0, 0.0]
+        self._queue_depth = [0, 0]
+
+    def stage(self, name):
+        """Context manager timing one stage (encode, crc, write, read, ...)."""
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return _StageTimer(self, name)
+
+    def wrap(self, name, func):
+        """Return ``func`` timed as stage ``name`` when enabled."""
+        if not self.enabled:
+            return func
+
+        def timed(*args, **kwargs):
+            with _StageTimer(self, name):
+                return func(*args, **kwargs)
+        return timed
+
+    def record(self, name, seconds):
+        with self._lock:
+            stat = self._stages.setdefault(name, [0, 0.0, 0.0])
+            stat[0] += 1
+            stat[1] += seconds
+            stat[2] = max(stat[2], seconds)
+
+    def start_heartbeat(self, tk_root, interval_ms=100):
+        """Measure how late ``after`` callbacks fire on the Tk main loop."""
+        if not self.enabled:
+            return
+
+        def beat(expected):
+            now = time.perf_counter()
+            lag = max(0.0, now - expected)
+            depth = serial_task_queue.qsize()
+            with self._lock:
+                self._lag[0] += 1
+                self._lag[1] += lag
+                self._lag[2] = max(self._lag[2], lag)
+                self._queue_depth[0] = depth
+                self._queue_depth[1] = max(self._queue_depth[1], depth)
+            tk_root.after(interval_ms, beat, time.perf_counter() + interval_ms / 1000)
+
+        tk_root.after(interval_ms, beat, time.perf_counter() + interval_ms / 1000)
+
+    def snapshot(self, reset=False):
+        """Return a dict of current statistics (times in milliseconds)."""
+        with self._lock:
+            stages = {
+                name: {"count": c, "avg_ms": total * 1000 / c, "max_ms": peak * 1000}
+                for name, (c, total, peak) in self._stages.items()
+            }
+            count, total, peak = self._lag
+            snap = {
+                "stages": stages,
+                "lag_avg_ms": total * 1000 / count if count else 0.0,
+                "lag_max_ms": peak * 1000,
+                "queue_depth": self._queue_depth[0],
+                "queue_depth_max": self._queue_depth[1],
+                "queue_dropped": serial_task_queue.dropped,
+            }
+            if reset:
+                self._reset_counters()
+        return snap
+
+
+class _StageTimer:
+    __slots__ = ("_monitor", "_name", "_start")
+
+    def __init__(self, monitor, name):
+        self._monitor = monitor
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._monitor.record(self._name, time.perf_counter() - self._start)
+        return False
+
+
+def format_perf_summary(snap):
+    lines = [
+        f"Main-loop lag: avg={snap['lag_avg_ms']:.1f}ms max={snap['lag_max_ms']:.1f}ms",
+        f"Queue depth: now={snap['queue_depth']} max={snap['queue_depth_max']}"
+        f" stale-dropped={snap['queue_dropped']}",
+    ]
+    for name, stat in sorted(snap["stages"].items()):
+        lines.append(
+            f"{name:>9}: n={stat['count']} avg={stat['avg_ms']:.3f}ms max={stat['max_ms']:.3f}ms"
+        )
+    return lines
+
+
+class SamplingProfiler:
+    """Sample the stacks of all threads and write them as collapsed stacks.
+
+    The output (``thread;outer;...;inner count`` per line) can be fed to
+    flamegraph.pl, speedscope or similar viewers. Sampling covers the Tk
+    main thread and ``serial_worker`` alike, unlike cProfile which only
+    sees the thread that enabled it.
+    """
+
+    def __init__(self, path, interval=0.005):
+        self.path = path
+        self.interval = interval
+        self._counts = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="perf_sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling, write the profile and return the sample count."""
+        self._stop.set()
+        self._thread.join()
+        with open(self.path, "w", encoding="utf-8") as fp:
+            for stack, count in sorted(self._counts.items()):
+                fp.write(f"{stack} {count}\n")
+        return sum(self._counts.values())
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                funcs = []
+                while frame is not None:
+                    code = frame.f_code
+                    funcs.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                funcs.append(names.get(ident, str(ident)))
+                key = ";".join(reversed(funcs))
+                self._counts[key] = self._counts.get(key, 0) + 1
+
+
+perf = PerfMonitor()
 
 
 def _set_window_icon(window):
@@ -169,12 +339,28 @@ class ModbusMasterGUI:
             row=0, column=4, padx=2, sticky="ew"
         )
 
-        self.reg_listbox = tk.Listbox(self.root, height=8)
-        for reg in self.reg_table:
-            self.reg_listbox.insert(tk.END, reg['display'])
-        self.reg_listbox.grid(row=1, column=0, columnspan=2, padx=5, pady=5, sticky="nsew")
+        list_frame = ttk.Frame(self.root)
+        list_frame.grid(row=1, column=0, columnspan=2, padx=5, pady=5, sticky="nsew")
+        list_frame.columnconfigure(1, weight=1)
+        list_frame.rowconfigure(1, weight=1)
+
+        ttk.Label(list_frame, text="検索:").grid(row=0, column=0, padx=2, sticky="w")
+        self.reg_search_var = tk.StringVar()
+        ttk.Entry(list_frame, textvariable=self.reg_search_var).grid(row=0, column=1, padx=2, sticky="ew")
+        self.reg_match_label = ttk.Label(list_frame, width=12, anchor="e")
+        self.reg_match_label.grid(row=0, column=2, padx=2, sticky="e")
+
+        self.reg_listbox = tk.Listbox(list_frame, height=8)
+        self.reg_listbox.grid(row=1, column=0, columnspan=3, pady=(5, 0), sticky="nsew")
         self.reg_listbox.bind("<<ListboxSelect>>", self.on_reg_select)
 
+        self.reg_index = RegisterIndex(
+            [(reg["name"], reg["addr"], reg["type"], reg["access"]) for reg in self.reg_table]
+        )
+        self.listbox_reg_indices = []
+        self.reg_search_var.trace_add("write", lambda *_: self.apply_reg_filter())
+        self.apply_reg_filter()
+
         self.value_frame = tk.Frame(self.root)
         self.value_frame.grid(row=2, column=0, columnspan=2, sticky="ew")
 
@@ -186,26 +372,96 @@ class ModbusMasterGUI:
         self.write_single_btn = ttk.Button(self.btn_frame, text="Write (1)", command=self.on_write_single_button_pressed)
         # Write Multiボタン
         self.write_multi_btn = ttk.Button(self.btn_frame, text="Write (N)", command=self.on_write_multi_button_pressed)
+        # Sequenceボタン
+        self.sequence_btn = ttk.Button(self.btn_frame, text="▶ Sequence", command=self.on_sequence_button_pressed)
         self.read_btn.grid(row=0, column=0, padx=5)
         self.write_single_btn.grid(row=0, column=1, padx=5)
         self.write_multi_btn.grid(row=0, column=2, padx=5)
+        self.sequence_btn.grid(row=0, column=3, padx=5)
+        self.sequence_stop_event = None
 
         self.log_area = scrolledtext.ScrolledText(self.root, state="disabled")
         self.log_area.grid(row=4, column=0, columnspan=2, padx=5, pady=5, sticky="nsew")
 
         ttk.Button(self.root, text="Reset", command=self.reset_app).grid(row=5, column=0, columnspan=2, pady=5)
 
+        if perf.enabled:
+            self.build_perf_bar()
+
+    def build_perf_bar(self):
+        perf_frame = ttk.Frame(self.root)
+        perf_frame.grid(row=6, column=0, columnspan=2, padx=5, pady=2, sticky="ew")
+        perf_frame.columnconfigure(0, weight=1)
+
+        self.perf_label = ttk.Label(perf_frame, anchor="w")
+        self.perf_label.grid(row=0, column=0, sticky="ew")
+        ttk.Button(perf_frame, text="Report", command=self.log_perf_report).grid(row=0, column=1, padx=2)
+        self.profile_btn = ttk.Button(perf_frame, text="● Profile", command=self.toggle_profiling)
+        self.profile_btn.grid(row=0, column=2, padx=2)
+
+        self.profiler = None
+        perf.start_heartbeat(self.root)
+        self.refresh_perf_label()
+
+    def refresh_perf_label(self):
+        snap = perf.snapshot()
+        self.perf_label.config(
+            text=(
+                f"lag avg {snap['lag_avg_ms']:.1f}ms / max {snap['lag_max_ms']:.1f}ms  "
+                f"queue {snap['queue_depth']} (max {snap['queue_depth_max']})"
+            )
+        )
+        self.root.after(1000, self.refresh_perf_label)
+
+    def log_perf_report(self):
+        self.log("\n[Perf Report]")
+        for line in format_perf_summary(perf.snapshot(reset=True)):
+            self.log(f"→ {line}")
+
+    def toggle_profiling(self):
+        if self.profiler is None:
+            path = filedialog.asksaveasfilename(
+                defaultextension=".folded",
+                filetypes=[("Collapsed stacks", "*.folded"), ("All files", "*.*")],
+            )
+            if not path:
+                return
+            self.profiler = SamplingProfiler(path)
+            self.profiler.start()
+            self.profile_btn.config(text="■ Profile")
+            self.log(f"[Info] Profiling started → {path}")
+        else:
+            profiler, self.profiler = self.profiler, None
+            try:
+                samples = profiler.stop()
+                self.log(f"[Info] Profiling stopped: {samples} samples written to {profiler.path}")
+            except OSError as e:
+                self.log(f"[Error] Profile write failed: {e}")
+            finally:
+                self.profile_btn.config(text="● Profile")
+
     def reset_app(self):
         self.log("[Info] Resetting application...")
         self.root.update()
+        close_poll_image()
+        stop_tcp_gateway()
         python = sys.executable
         os.execl(python, python, *sys.argv)
 
+    def apply_reg_filter(self):
+        self.listbox_reg_indices = self.reg_index.search(self.reg_search_var.get())
+        self.reg_listbox.delete(0, tk.END)
+        if self.listbox_reg_indices:
+            self.reg_listbox.insert(
+                tk.END, *(self.reg_table[i]["display"] for i in self.listbox_reg_indices)
+            )
+        self.reg_match_label.config(text=f"{len(self.listbox_reg_indices)}/{len(self.reg_table)}")
+
     def on_reg_select(self, event):
         selection = event.widget.curselection()
         if not selection:
             return
-        index = selection[0]
+        index = self.listbox_reg_indices[selection[0]]
         self.current_reg = self.reg_table[index]
         self.update_buttons_and_inputs()
 
@@ -304,7 +560,7 @@ class ModbusMasterGUI:
             self.log("[Error] No register selected.")
             return
 
-        index = selection[0]
+        index = self.listbox_reg_indices[selection[0]]
         self.current_reg = self.reg_table[index]
         self.update_buttons_and_inputs()  # エントリ更新＆ボタン有効化
 
@@ -312,7 +568,10 @@ class ModbusMasterGUI:
         length = self.current_reg['length'] * (2 if self.current_reg['type'] in ["float", "uint32_t"] else 1)
 
         self.log(f"\n[Send] → Read Holding Register: Addr=0x{addr:04X}, Count={length}")
-        queue_send_read(self.serial_port, self.slave_addr, addr, length, self.handle_read_result)
+        queue_send_read(
+            self.serial_port, self.slave_addr, addr, length, self.handle_read_result,
+            on_wait=self.log_queue_wait,
+        )
 
 
     def handle_read_result(self, data):
@@ -362,6 +621,9 @@ class ModbusMasterGUI:
         return formatted
 
 
+    def log_queue_wait(self, seconds):
+        self.log(f"[Queue] → Wait: {seconds * 1000:.1f} ms")
+
     def log(self, text):
         self.log_area.config(state="normal")
         self.log_area.insert(tk.END, text + "\n")
@@ -381,7 +643,8 @@ class ModbusMasterGUI:
 
         addr = self.current_reg['addr']
         queue_send_write_single(
-            self.serial_port, self.slave_addr, addr, val, self.handle_write_single_result
+            self.serial_port, self.slave_addr, addr, val, self.handle_write_single_result,
+            on_wait=self.log_queue_wait,
         )
 
     def handle_write_single_result(self, data):
@@ -424,7 +687,8 @@ class ModbusMasterGUI:
         typ = self.current_reg['type']
 
         queue_send_write_multi(
-            self.serial_port, self.slave_addr, addr, values, typ, self.handle_write_multi_result
+            self.serial_port, self.slave_addr, addr, values, typ, self.handle_write_multi_result,
+            on_wait=self.log_queue_wait,
         )
 
     def handle_write_multi_result(self, data):
@@ -451,11 +715,77 @@ class ModbusMasterGUI:
         else:
             self.log(f"→ ACK (Raw): {data.hex().upper()}")
 
+    def on_sequence_button_pressed(self):
+        if self.sequence_stop_event is not None:
+            self.sequence_stop_event.set()
+            self.log("[Sequence] Stop requested.")
+            return
+
+        path = filedialog.askopenfilename(
+            filetypes=[("Sequence scripts", "*.yaml *.yml *.json"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+        try:
+            script = load_sequence(path)
+            steps = compile_sequence(script, self.reg_table)
+        except (OSError, ValueError, SequenceError) as e:
+            messagebox.showerror("Sequence Error", str(e))
+            return
+
+        name = str(script.get("name") or os.path.basename(path))
+        self.sequence_stop_event = threading.Event()
+        self.sequence_btn.config(text="■ Sequence")
+        self.log(f"\n[Sequence] Start: {name} ({len(steps)} steps)")
+
+        serial_port = self.serial_port
+        unit_id = self.slave_addr
+        runner = SequenceRunner(
+            steps,
+            read=lambda reg: read_register_values(serial_port, unit_id, reg),
+            write=lambda reg, index, values: sequence_write(serial_port, unit_id, reg, index, values),
+            name=name,
+            stop_on_fail=bool(script.get("stop_on_fail", True)),
+            stop_event=self.sequence_stop_event,
+            on_step=lambda result: _post_to_ui(lambda: self.handle_sequence_step(result)),
+        )
+        queue_run_sequence(runner, lambda report: self.handle_sequence_report(path, report))
+
+    def handle_sequence_step(self, result):
+        target = f" {result['target']}" if result["target"] else ""
+        line = f"→ #{result['step']} {result['action']}{target}: {result['status'].upper()} ({result['latency_ms']:.1f} ms)"
+        if result["value"] is not None:
+            line += f" value={result['value']}"
+        if result["message"]:
+            line += f" - {result['message']}"
+        self.log(line)
+
+    def handle_sequence_report(self, script_path, report):
+        self.sequence_stop_event = None
+        self.sequence_btn.config(text="▶ Sequence")
+
+        if report.get("error"):
+            self.log(f"[Sequence] Error: {report['error']}")
+        counts = report["counts"]
+        self.log(
+            f"[Sequence] {'PASS' if report['passed'] else 'FAIL'}: {report['name']} "
+            f"pass={counts['pass']} fail={counts['fail']} error={counts['error']} "
+            f"skipped={counts['skipped']} total={report['total_ms']:.1f} ms"
+        )
+        stem = os.path.splitext(script_path)[0]
+        report_path = f"{stem}_report_{time.strftime('%Y%m%d_%H%M%S')}.json"
+        try:
+            with open(report_path, "w", encoding="utf-8") as fp:
+                json.dump(report, fp, ensure_ascii=False, indent=2)
+            self.log(f"[Sequence] Report: {report_path}")
+        except OSError as e:
+            self.log(f"[Sequence] Report write failed: {e}")
+
     def init_polling_gui(self):
         self.polling_widgets = []
 
         self.polling_frame = ttk.Frame(self.root, width=300, relief=tk.SUNKEN, padding=5)
-        self.polling_frame.grid(row=0, column=2, rowspan=6, sticky="nsew")
+        self.polling_frame.grid(row=0, column=2, rowspan=7, sticky="nsew")
         self.root.columnconfigure(2, weight=0, minsize=280)
 
         # --- Polling制御バー ---
@@ -480,6 +810,20 @@ class ModbusMasterGUI:
         self.start_btn.config(command=self.start_polling_loop)
         self.stop_btn.config(command=self.stop_polling_loop)
 
+        # --- Polling対象の検索・一括チェック ---
+        search_frame = ttk.Frame(self.polling_frame)
+        search_frame.pack(fill=tk.X, pady=2)
+
+        ttk.Label(search_frame, text="検索:").pack(side=tk.LEFT)
+        self.polling_search_var = tk.StringVar()
+        ttk.Entry(search_frame, textvariable=self.polling_search_var, width=14).pack(
+            side=tk.LEFT, fill=tk.X, expand=True, padx=2
+        )
+        ttk.Button(search_frame, text="☑ All", width=6,
+                   command=lambda: self.set_polling_matches_checked(True)).pack(side=tk.LEFT, padx=1)
+        ttk.Button(search_frame, text="☐ All", width=6,
+                   command=lambda: self.set_polling_matches_checked(False)).pack(side=tk.LEFT, padx=1)
+
         # --- スクロール可能なレジスタ一覧 ---
         canvas_frame = ttk.Frame(self.polling_frame)
         canvas_frame.pack(fill=tk.BOTH, expand=True)
@@ -542,6 +886,9 @@ class ModbusMasterGUI:
                     "reg": reg,
                     "index": index,
                     "word_size": word_size,
+                    "name": name,
+                    "addr": reg["addr"] + index * word_size,
+                    "row": row,
                     "var": var,
                     "value_label": val_label,
                     "prev": None
@@ -549,6 +896,27 @@ class ModbusMasterGUI:
 
         self.polling_index = 0
 
+        self.polling_search_index = RegisterIndex(
+            [(e["name"], e["addr"], e["reg"]["type"], e["reg"]["access"]) for e in self.polling_widgets]
+        )
+        self.polling_visible = list(range(len(self.polling_widgets)))
+        self.polling_search_var.trace_add("write", lambda *_: self.apply_polling_filter())
+
+    def apply_polling_filter(self):
+        matches = self.polling_search_index.search(self.polling_search_var.get())
+        if matches == self.polling_visible:
+            return
+        for pos in self.polling_visible:
+            self.polling_widgets[pos]["row"].pack_forget()
+        for pos in matches:
+            self.polling_widgets[pos]["row"].pack(fill=tk.X, pady=1)
+        self.polling_visible = matches
+        self.canvas.yview_moveto(0)
+
+    def set_polling_matches_checked(self, checked):
+        for pos in self.polling_visible:
+            self.polling_widgets[pos]["var"].set(checked)
+
     def start_polling_loop(self):
         try:
             interval = int(self.polling_interval_entry.get())
@@ -581,13 +949,14 @@ class ModbusMasterGUI:
         if not self._polling_active:
             return
 
+        # 1 回の読み出しでレジスタ全体がデコードされるため、要求はレジスタ単位にまとめる
+        checked = {}
         for entry in self.polling_widgets:
-            if not entry["var"].get():
-                continue
+            if entry["var"].get():
+                checked.setdefault((entry["reg"]["addr"], entry["reg"]["name"]), []).append(entry)
 
-            reg = entry["reg"]
-            index = entry["index"]
-            label = entry["value_label"]
+        for (addr, name), entries in checked.items():
+            reg = entries[0]["reg"]
 
             def make_cb(entry):
                 def cb(reg, data):
@@ -612,7 +981,16 @@ class ModbusMasterGUI:
                         entry["prev"] = None
                 return cb
 
-            queue_send_read_for(self.serial_port, self.slave_addr, reg, make_cb(entry))
+            def make_fan_out(callbacks):
+                def fan_out(reg, data):
+                    for cb in callbacks:
+                        cb(reg, data)
+                return fan_out
+
+            # 同じレジスタの未送信ポーリングは最新の要求で置き換える
+            key = ("poll", addr, name)
+            callback = make_fan_out([make_cb(entry) for entry in entries])
+            queue_send_read_for(self.serial_port, self.slave_addr, reg, callback, key=key)
 
         self._polling_task_id = self.root.after(interval, self.polling_loop, interval)
 
@@ -631,93 +1009,160 @@ class ModbusMasterGUI:
         return cb
     
 
-# --- キュー化された通信処理（Read） ---
-def queue_send_read(serial_port, unit_id, addr, length, callback):
-    def task():
-        try:
-            frame = struct.pack('>B B H H', unit_id, 0x03, addr, length)
-            crc = calc_crc(frame)
-            frame += struct.pack('<H', crc)
-            serial_port.reset_input_buffer()
-            serial_port.write(frame)
-            resp = serial_port.read(5 + length * 2)
-            if len(resp) < 5:
-                data = None
-            else:
-                data = resp
-        except Exception:
-            data = None
-        root.after(0, lambda: callback(data))
-
-    serial_task_queue.put((task, (), {}))
-
-# --- キュー化された通信処理（Write Single Register） ---
-def queue_send_write_single(serial_port, unit_id, addr, value, callback):
-    def task():
-        try:
+# --- ポーリング値の共有メモリ公開 ---
+def open_poll_image(reg_table, name):
+    global poll_image
+    poll_image = SharedPollImage(reg_table, name)
+    return poll_image
+
+def close_poll_image():
+    global poll_image
+    image, poll_image = poll_image, None
+    if image is not None:
+        image.close()
+
+# --- Modbus TCP ゲートウェイ（ポーリング結果のキャッシュを配信） ---
+def start_tcp_gateway(app, host, port, max_age):
+    """Serve FC03 from the poll cache and forward writes through the send queue.
+
+    Gateway traffic uses the poll lane, so the user's own Read/Write buttons
+    still go first, and responses are delivered on the worker thread.
+    """
+    global bus_cache, tcp_gateway
+    cache = gateway_mod.RegisterCache()
+    tcp_gateway = gateway_mod.ModbusTcpGateway(
+        cache,
+        read=lambda unit, addr, count, done: queue_send_read(
+            app.serial_port, unit, addr, count, done, lane=LANE_POLL, on_worker=True
+        ),
+        write_single=lambda unit, addr, value, done, claim: queue_send_write_single(
+            app.serial_port, unit, addr, value, done, lane=LANE_POLL, on_worker=True, claim=claim
+        ),
+        write_multi=lambda unit, addr, values, done, claim: queue_send_write_multi(
+            app.serial_port, unit, addr, values, "uint16_t", done, lane=LANE_POLL, on_worker=True, claim=claim
+        ),
+        host=host,
+        port=port,
+        max_age=max_age,
+        resolve_unit=lambda unit: app.slave_addr if unit in (0, 255) else unit,
+    )
+    bus_cache = cache
+    tcp_gateway.start()
+    return tcp_gateway
+
+def stop_tcp_gateway():
+    global bus_cache, tcp_gateway
+    gateway, tcp_gateway = tcp_gateway, None
+    bus_cache = None
+    if gateway is not None:
+        gateway.stop()
+
+# --- フレーム組み立て・送受信の共通処理 ---
+def _finish_frame(frame):
+    with perf.stage("crc"):
+        crc = calc_crc(frame)
+    return frame + struct.pack('<H', crc)
+
+def _exchange(serial_port, frame, read_size):
+    with perf.stage("write"):
+        serial_port.reset_input_buffer()
+        serial_port.write(frame)
+    with perf.stage("read"):
+        return serial_port.read(read_size)
+
+def _post_to_ui(func):
+    root.after(0, perf.wrap("ui_apply", func))
+
+def _deliver(func, on_worker):
+    # on_worker=True はTkを経由せずワーカースレッド上で直接呼ぶ（ゲートウェイ用）
+    if on_worker:
+        func()
+    else:
+        _post_to_ui(func)
+
+def _enqueue(task, lane, key=None, on_wait=None):
+    """Queue ``task`` on ``lane``; ``on_wait(seconds)`` reports its queue wait."""
+    queued_at = time.perf_counter()
+
+    def run():
+        wait = time.perf_counter() - queued_at
+        if perf.enabled:
+            perf.record(f"wait_{LANE_NAMES[lane]}", wait)
+        if on_wait is not None:
+            _post_to_ui(lambda: on_wait(wait))
+        task()
+
+    serial_task_queue.put((run, (), {}), lane, key)
+
+def _invalidate_cache(unit_id, addr, count):
+    # 応答の有無にかかわらず書き込み先の値は変わり得るため、キャッシュを破棄する
+    cache = bus_cache
+    if cache is not None:
+        cache.invalidate(unit_id, addr, count)
+
+# --- 同期通信処理（ワーカースレッド上で呼び出す） ---
+def read_holding_registers(serial_port, unit_id, addr, count):
+    """FC03: return the raw response frame, or None when nothing usable arrived."""
+    try:
+        with perf.stage("encode"):
+            frame = struct.pack('>B B H H', unit_id, 0x03, addr, count)
+        frame = _finish_frame(frame)
+        resp = _exchange(serial_port, frame, 5 + count * 2)
+        if len(resp) < 5:
+            return None
+        cache = bus_cache
+        if cache is not None and not resp[1] & 0x80 and resp[2] == count * 2 and len(resp) >= 3 + count * 2:
+            cache.store(unit_id, addr, resp[3:3 + count * 2])
+        return resp
+    except Exception:
+        return None
+
+def read_register_values(serial_port, unit_id, reg):
+    """FC03 read of a whole register entry, decoded by its type, or None."""
+    try:
+        length = reg["length"]
+        typ = reg["type"]
+        word_count = length * (2 if typ in ["float", "uint32_t"] else 1)
+
+        resp = read_holding_registers(serial_port, unit_id, reg["addr"], word_count)
+        if resp is None:
+            return None
+        with perf.stage("decode"):
+            byte_count = resp[2]
+            values = resp[3:3 + byte_count]
+            if typ == "uint16_t":
+                return struct.unpack('>' + 'H' * length, bytes(values))
+            elif typ == "uint32_t":
+                return struct.unpack('>' + 'I' * length, bytes(values))
+            elif typ == "float":
+                return struct.unpack('>' + 'f' * length, bytes(values))
+            return None
+    except Exception:
+        return None
+
+def write_single_register(serial_port, unit_id, addr, value):
+    """FC06: return the ACK or exception frame, or None on failure."""
+    try:
+        with perf.stage("encode"):
             frame = struct.pack('>B B H H', unit_id, 0x06, addr, value)
-            crc = calc_crc(frame)
-            frame += struct.pack('<H', crc)
-            serial_port.reset_input_buffer()
-            serial_port.write(frame)
-            resp = serial_port.read(256)  # 長さ8固定ではなく全体を読む
-
-            if not resp:
-                result = None
-            elif resp[1] & 0x80:  # Exception応答
-                result = resp
-            elif len(resp) >= 8:  # 正常ACK応答
-                result = resp
-            else:
-                result = None  # それ以外は異常
-
-        except Exception:
-            result = None
-
-        root.after(0, lambda: callback(result))
-
-    serial_task_queue.put((task, (), {}))
-
-# --- キュー化された通信処理（Polling用 Read） ---
-def queue_send_read_for(serial_port, unit_id, reg, callback):
-    def task():
-        try:
-            addr = reg["addr"]
-            length = reg["length"]
-            typ = reg["type"]
-            word_count = length * (2 if typ in ["float", "uint32_t"] else 1)
-
-            frame = struct.pack('>B B H H', unit_id, 0x03, addr, word_count)
-            crc = calc_crc(frame)
-            frame += struct.pack('<H', crc)
-            serial_port.reset_input_buffer()
-            serial_port.write(frame)
-            resp = serial_port.read(5 + word_count * 2)
-
-            if len(resp) < 5:
-                parsed = None
-            else:
-                byte_count = resp[2]
-                values = resp[3:3 + byte_count]
-                if typ == "uint16_t":
-                    parsed = struct.unpack('>' + 'H' * length, bytes(values))
-                elif typ == "uint32_t":
-                    parsed = struct.unpack('>' + 'I' * length, bytes(values))
-                elif typ == "float":
-                    parsed = struct.unpack('>' + 'f' * length, bytes(values))
-                else:
-                    parsed = None
-        except Exception:
-            parsed = None
-
-        root.after(0, lambda: callback(reg, parsed))
-
-    serial_task_queue.put((task, (), {}))
-
-# --- キュー化された通信処理（Write Multiple Registers） ---
-def queue_send_write_multi(serial_port, unit_id, addr, values, typ, callback):
-    def task():
-        try:
+        frame = _finish_frame(frame)
+        resp = _exchange(serial_port, frame, 256)  # 長さ8固定ではなく全体を読む
+        _invalidate_cache(unit_id, addr, 1)
+
+        if not resp:
+            return None
+        elif resp[1] & 0x80:  # Exception応答
+            return resp
+        elif len(resp) >= 8:  # 正常ACK応答
+            return resp
+        return None  # それ以外は異常
+    except Exception:
+        return None
+
+def write_multiple_registers(serial_port, unit_id, addr, values, typ):
+    """FC10: return the ACK or exception frame, or None on failure."""
+    try:
+        with perf.stage("encode"):
             encoded = b''
             for v in values:
                 if typ == "uint16_t":
@@ -732,31 +1177,154 @@ def queue_send_write_multi(serial_port, unit_id, addr, values, typ, callback):
             num_regs = len(encoded) // 2
             byte_count = len(encoded)
             frame = struct.pack('>B B H H B', unit_id, 0x10, addr, num_regs, byte_count) + encoded
-            crc = calc_crc(frame)
-            frame += struct.pack('<H', crc)
-
-            serial_port.reset_input_buffer()
-            serial_port.write(frame)
-            resp = serial_port.read(256)  # 読み取りバッファを拡大し、Exceptionも拾えるように
-
-            if not resp:
-                result = None
-            elif resp[1] & 0x80:  # 異常応答の判定（例: 0x90）
-                result = resp
-            elif len(resp) < 8:
-                result = None
-            else:
-                result = resp
+        frame = _finish_frame(frame)
+
+        resp = _exchange(serial_port, frame, 256)  # 読み取りバッファを拡大し、Exceptionも拾えるように
+        _invalidate_cache(unit_id, addr, num_regs)
+
+        if not resp:
+            return None
+        elif resp[1] & 0x80:  # 異常応答の判定（例: 0x90）
+            return resp
+        elif len(resp) < 8:
+            return None
+        return resp
+    except Exception:
+        return None
+
+# --- キュー化された通信処理（Read） ---
+def queue_send_read(serial_port, unit_id, addr, length, callback, lane=LANE_INTERACTIVE, on_wait=None, on_worker=False):
+    def task():
+        data = read_holding_registers(serial_port, unit_id, addr, length)
+        _deliver(lambda: callback(data), on_worker)
 
-        except Exception:
-            result = None
+    _enqueue(task, lane, on_wait=on_wait)
 
-        root.after(0, lambda: callback(result))
+# --- キュー化された通信処理（Write Single Register） ---
+def queue_send_write_single(serial_port, unit_id, addr, value, callback, lane=LANE_INTERACTIVE, on_wait=None, on_worker=False, claim=None):
+    def task():
+        if claim is not None and not claim():
+            return  # 要求元がタイムアウト済み（送信しない）
+        result = write_single_register(serial_port, unit_id, addr, value)
+        _deliver(lambda: callback(result), on_worker)
 
-    serial_task_queue.put((task, (), {}))
+    _enqueue(task, lane, on_wait=on_wait)
+
+# --- キュー化された通信処理（Polling用 Read） ---
+def queue_send_read_for(serial_port, unit_id, reg, callback, lane=LANE_POLL, key=None):
+    def task():
+        parsed = read_register_values(serial_port, unit_id, reg)
+        image = poll_image
+        if image is not None:
+            image.publish(reg, parsed)
+        _post_to_ui(lambda: callback(reg, parsed))
 
-def main():
+    _enqueue(task, lane, key=key)
+
+# --- キュー化された通信処理（Write Multiple Registers） ---
+def queue_send_write_multi(serial_port, unit_id, addr, values, typ, callback, lane=LANE_INTERACTIVE, on_wait=None, on_worker=False, claim=None):
+    def task():
+        if claim is not None and not claim():
+            return  # 要求元がタイムアウト済み（送信しない）
+        result = write_multiple_registers(serial_port, unit_id, addr, values, typ)
+        _deliver(lambda: callback(result), on_worker)
+
+    _enqueue(task, lane, on_wait=on_wait)
+
+# --- シーケンス実行（ワーカー上で連続実行） ---
+SEQUENCE_STOP_CHECK_MS = 100  # 待機中に停止要求を確認する間隔
+def sequence_write(serial_port, unit_id, reg, index, values):
+    """Write ``values`` to ``reg`` (or one element); return an error message or None."""
+    typ = reg["type"]
+    word_size = 2 if typ in ["float", "uint32_t"] else 1
+    addr = reg["addr"] + (index or 0) * word_size
+    if typ == "uint16_t" and len(values) == 1:
+        resp = write_single_register(serial_port, unit_id, addr, int(values[0]))
+    else:
+        resp = write_multiple_registers(serial_port, unit_id, addr, values, typ)
+    if resp is None:
+        return "No Response"
+    if resp[1] & 0x80:
+        code = resp[2] if len(resp) > 2 else 0
+        return f"Exception Response: Func=0x{resp[1]:02X}, Code=0x{code:02X}"
+    return None
+
+def queue_run_sequence(runner, callback, lane=LANE_BULK):
+    """Drive ``runner`` one worker task per step so other lanes can interleave.
+
+    Pauses are timed with ``root.after`` (no thread per pause) and cut short
+    when the stop event is set. ``callback`` always receives a report, even
+    when driving the runner raises.
+    """
+    steps = runner.run_iter()
+
+    def finish(report):
+        _post_to_ui(lambda: callback(report))
+
+    def task():
+        try:
+            delay = next(steps)
+        except StopIteration as done:
+            finish(done.value)
+            return
+        except Exception as e:
+            finish(runner.report(error=f"{type(e).__name__}: {e}"))
+            return
+        if delay > 0:
+            # 待ち時間はワーカーを占有せず、Tk のタイマーで待ってから再投入する
+            resume(time.perf_counter() + delay)
+        else:
+            _enqueue(task, lane)
+
+    def resume(deadline):
+        remaining_ms = int((deadline - time.perf_counter()) * 1000)
+        stopped = runner.stop_event is not None and runner.stop_event.is_set()
+        if remaining_ms <= 0 or stopped:
+            _enqueue(task, lane)
+        else:
+            root.after(min(remaining_ms, SEQUENCE_STOP_CHECK_MS), resume, deadline)
+
+    _enqueue(task, lane)
+
+def main(argv=None):
     """Launch the RegiStar Modbus master GUI."""
+    parser = argparse.ArgumentParser(prog="registar", description="RegiStar Modbus master simulator")
+    parser.add_argument(
+        "--perf",
+        action="store_true",
+        help="enable stage timers, main-loop lag monitor and the profiling toggle",
+    )
+    parser.add_argument(
+        "--shm",
+        nargs="?",
+        const=SHM_DEFAULT_NAME,
+        metavar="NAME",
+        help=f"publish polled values to a shared-memory block (default name: {SHM_DEFAULT_NAME})",
+    )
+    parser.add_argument(
+        "--gateway",
+        nargs="?",
+        type=int,
+        const=gateway_mod.DEFAULT_PORT,
+        metavar="PORT",
+        help=f"run a caching Modbus TCP gateway (default port: {gateway_mod.DEFAULT_PORT})",
+    )
+    parser.add_argument(
+        "--gateway-host",
+        default=gateway_mod.DEFAULT_HOST,
+        metavar="HOST",
+        help=f"address the gateway listens on (default: {gateway_mod.DEFAULT_HOST})",
+    )
+    parser.add_argument(
+        "--gateway-max-age",
+        type=float,
+        default=gateway_mod.DEFAULT_MAX_AGE,
+        metavar="SEC",
+        help=f"max cache age before a read goes to the bus (default: {gateway_mod.DEFAULT_MAX_AGE})",
+    )
+    args = parser.parse_args(argv)
+    perf.enabled = args.perf
+
     global root
     root = tk.Tk()
     _set_window_icon(root)
@@ -768,9 +1336,25 @@ def main():
         sys.exit(0)
 
     reg_table = extract_registers_from_excel(file_path)
+    if args.shm:
+        try:
+            open_poll_image(reg_table, args.shm)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Shared Memory Error", f"共有メモリ公開を開始できません: {e}")
     root.deiconify()
     app = ModbusMasterGUI(root, reg_table)
-    root.mainloop()
+    if args.gateway is not None:
+        try:
+            gateway = start_tcp_gateway(app, args.gateway_host, args.gateway, args.gateway_max_age)
+            host, port = gateway.address
+            app.log(f"[Gateway] Modbus TCP listening on {host}:{port} (max age {args.gateway_max_age:g} s)")
+        except OSError as e:
+            messagebox.showerror("Gateway Error", f"Modbus TCP ゲートウェイを開始できません: {e}")
+    try:
+        root.mainloop()
+    finally:
+        stop_tcp_gateway()
+        close_poll_image()
 
 
 # --- エントリーポイント ---
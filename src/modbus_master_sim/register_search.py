@@ -0,0 +1,158 @@
+"""Incremental register search used by the register and polling lists.
+
+This module only depends on the standard library so that the index can be
+built and queried without Tk, pyserial or pandas.
+"""
+
+import bisect
+from collections import namedtuple
+
+SEARCH_GRAM_SIZE = 3
+
+SearchQuery = namedtuple("SearchQuery", ["terms", "addr_range", "facets", "numbers"])
+
+
+def parse_search_query(text):
+    """Split a search string into name terms, an address range and facets.
+
+    Supported tokens: ``type:<t>``, ``access:<R|W|RW>``, ``addr:<a>[-<b>]``
+    and free text matched as a case-insensitive substring of the register
+    name. Bare numbers or ranges (``1``, ``0x10-0x1F``) are returned in
+    ``numbers`` as ``(text, (low, high))`` and match either the address range
+    or the name, so ``1`` still finds ``X1``.
+    """
+    terms = []
+    addr_range = None
+    facets = {}
+    numbers = []
+    for token in text.split():
+        key, sep, value = token.partition(":")
+        key = key.lower()
+        if sep and key in ("type", "access") and value:
+            facets[key] = value if key == "type" else value.upper()
+            continue
+        if sep and key == "addr":
+            parsed = _parse_addr_range(value)
+            if parsed is not None:
+                addr_range = parsed
+            continue
+        parsed = _parse_addr_range(token)
+        if parsed is not None:
+            numbers.append((token.lower(), parsed))
+        else:
+            terms.append(token.lower())
+    return SearchQuery(terms, addr_range, facets, numbers)
+
+
+def _parse_addr_range(token):
+    low, sep, high = token.partition("-")
+    try:
+        low_val = int(low, 0)
+        high_val = int(high, 0) if sep else low_val
+    except ValueError:
+        return None
+    return (min(low_val, high_val), max(low_val, high_val))
+
+
+class RegisterIndex:
+    """Prebuilt lookup tables for incremental register search.
+
+    ``items`` is a sequence of ``(name, addr, type, access)`` tuples; search
+    results are returned as positions into that sequence, in original order.
+    """
+
+    def __init__(self, items):
+        self._names = []
+        self._addrs = []
+        self._grams = {}
+        self._facets = {"type": {}, "access": {}}
+        addr_pairs = []
+        for pos, (name, addr, typ, access) in enumerate(items):
+            lowered = name.lower()
+            self._names.append(lowered)
+            self._addrs.append(addr)
+            for size in range(1, SEARCH_GRAM_SIZE + 1):
+                for start in range(len(lowered) - size + 1):
+                    self._grams.setdefault(lowered[start:start + size], set()).add(pos)
+            self._facets["type"].setdefault(typ, set()).add(pos)
+            self._facets["access"].setdefault(access, set()).add(pos)
+            addr_pairs.append((addr, pos))
+        addr_pairs.sort()
+        self._addr_keys = [addr for addr, _ in addr_pairs]
+        self._addr_positions = [pos for _, pos in addr_pairs]
+        self._all = frozenset(range(len(self._names)))
+        self._last_query = None
+        self._last_result = None
+
+    def __len__(self):
+        return len(self._names)
+
+    def search(self, text):
+        """Return matching positions for ``text`` (see ``parse_search_query``)."""
+        text = text.strip()
+        if not text:
+            return list(range(len(self._names)))
+        if text == self._last_query:
+            return self._last_result
+
+        query = parse_search_query(text)
+        candidates = None
+        if query.addr_range is not None:
+            candidates = self._addr_lookup(*query.addr_range)
+        for key, value in query.facets.items():
+            candidates = self._intersect(candidates, self._facet_lookup(key, value))
+        for number, addr_range in query.numbers:
+            candidates = self._intersect(
+                candidates, self._addr_lookup(*addr_range) | self._term_candidates(number)
+            )
+        for term in query.terms:
+            candidates = self._intersect(candidates, self._term_candidates(term))
+            if not candidates:
+                break
+
+        if candidates is None:
+            candidates = self._all
+        result = sorted(
+            pos for pos in candidates
+            if all(term in self._names[pos] for term in query.terms)
+            and all(
+                number in self._names[pos] or low <= self._addrs[pos] <= high
+                for number, (low, high) in query.numbers
+            )
+        )
+        self._last_query = text
+        self._last_result = result
+        return result
+
+    def _addr_lookup(self, low, high):
+        left = bisect.bisect_left(self._addr_keys, low)
+        right = bisect.bisect_right(self._addr_keys, high)
+        return set(self._addr_positions[left:right])
+
+    def _facet_lookup(self, key, value):
+        table = self._facets[key]
+        if key == "type":
+            lowered = value.lower()
+            matched = set()
+            for typ, positions in table.items():
+                if typ.lower().startswith(lowered):
+                    matched |= positions
+            return matched
+        return set(table.get(value, ()))
+
+    def _term_candidates(self, term):
+        if len(term) <= SEARCH_GRAM_SIZE:
+            return self._grams.get(term, set())
+        found = None
+        for start in range(len(term) - SEARCH_GRAM_SIZE + 1):
+            positions = self._grams.get(term[start:start + SEARCH_GRAM_SIZE], set())
+            found = positions if found is None else found & positions
+            if not found:
+                return set()
+        return found
+
+    @staticmethod
+    def _intersect(current, positions):
+        if current is None:
+            return set(positions)
+        return current & positions
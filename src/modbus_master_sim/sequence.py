@@ -0,0 +1,355 @@
+"""Scripted test sequences executed back-to-back on the serial worker.
+
+A script is a YAML (requires PyYAML) or JSON document referring to register
+names from the Excel map::
+
+    name: Pump start-up
+    stop_on_fail: true
+    steps:
+      - write: SETPOINT
+        value: 1200
+      - wait: TEMP
+        until: {ge: 50}
+        timeout: 30
+      - read: PRESSURE[0]
+        expect: {ge: 1.0, le: 2.0}
+        max_ms: 200
+      - sleep: 0.5
+
+Steps are ``write`` (``value`` scalar or list), ``read`` (optional
+``expect``), ``wait`` (``until`` polled every ``interval`` seconds until
+``timeout``) and ``sleep``. Conditions use ``eq``/``ne``/``lt``/``le``/
+``gt``/``ge``. Any step may carry ``max_ms`` as a timing assertion and a
+``label``. ``SequenceRunner.run`` returns a JSON-serialisable report with
+per-step latency.
+"""
+
+import json
+import operator
+import os
+import re
+import time
+import types
+from datetime import datetime
+
+try:
+    import yaml
+except ImportError:  # PyYAML は任意依存（JSON スクリプトは常に使える）
+    yaml = None
+
+CONDITION_OPS = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "lt": operator.lt,
+    "le": operator.le,
+    "gt": operator.gt,
+    "ge": operator.ge,
+}
+
+DEFAULT_WAIT_TIMEOUT = 10.0
+DEFAULT_WAIT_INTERVAL = 0.0
+
+_TARGET_RE = re.compile(r"^\s*(?P<name>[^\[\]]+?)\s*(?:\[\s*(?P<index>\d+)\s*\])?\s*$")
+
+
+class SequenceError(Exception):
+    """Raised for malformed scripts or references to unknown registers."""
+
+
+def load_sequence(path):
+    """Read a YAML or JSON script from ``path`` and return the parsed document."""
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, encoding="utf-8") as fp:
+        text = fp.read()
+    if ext == ".json":
+        try:
+            return json.loads(text)
+        except ValueError as e:
+            raise SequenceError(f"Invalid JSON: {e}")
+    if yaml is None:
+        raise SequenceError("YAML scripts require PyYAML (pip install pyyaml); use JSON instead.")
+    try:
+        return yaml.safe_load(text)
+    except yaml.YAMLError as e:
+        raise SequenceError(f"Invalid YAML: {e}")
+
+
+def compile_sequence(script, reg_table):
+    """Validate ``script`` against ``reg_table`` and return a list of steps.
+
+    All register names, access rights and conditions are checked up front so
+    that a typo fails before anything is sent on the bus.
+    """
+    if not isinstance(script, dict) or not isinstance(script.get("steps"), list):
+        raise SequenceError("Script must be a mapping with a 'steps' list.")
+    regs = {reg["name"]: reg for reg in reg_table}
+
+    steps = []
+    for number, raw in enumerate(script["steps"], start=1):
+        if not isinstance(raw, dict):
+            raise SequenceError(f"Step {number}: must be a mapping.")
+        actions = [key for key in ("write", "read", "wait", "sleep") if key in raw]
+        if len(actions) != 1:
+            raise SequenceError(f"Step {number}: needs exactly one of write/read/wait/sleep.")
+        action = actions[0]
+        step = {
+            "number": number,
+            "action": action,
+            "label": str(raw.get("label", "")),
+            "max_ms": _optional_float(raw, "max_ms", number),
+        }
+
+        if action == "sleep":
+            step["seconds"] = _as_float(raw["sleep"], number, "sleep")
+        else:
+            reg, index = _resolve_target(regs, raw[action], number)
+            step["target"] = str(raw[action]).strip()
+            step["reg"] = reg
+            step["index"] = index
+            if action == "write":
+                _require_access(reg, "W", number)
+                step["values"] = _write_values(reg, index, raw.get("value"), number)
+            else:
+                _require_access(reg, "R", number)
+                if action == "read":
+                    step["expect"] = _conditions(raw.get("expect"), number, "expect", optional=True)
+                else:
+                    step["until"] = _conditions(raw.get("until"), number, "until", optional=False)
+                    step["timeout"] = _optional_float(raw, "timeout", number, DEFAULT_WAIT_TIMEOUT)
+                    step["interval"] = _optional_float(raw, "interval", number, DEFAULT_WAIT_INTERVAL)
+        steps.append(step)
+    return steps
+
+
+def _resolve_target(regs, target, number):
+    match = _TARGET_RE.match(str(target))
+    if not match or match.group("name") not in regs:
+        raise SequenceError(f"Step {number}: unknown register '{target}'.")
+    reg = regs[match.group("name")]
+    index = match.group("index")
+    if index is None:
+        return reg, None
+    index = int(index)
+    if index >= reg["length"]:
+        raise SequenceError(f"Step {number}: index {index} out of range for '{reg['name']}'.")
+    return reg, index
+
+
+def _require_access(reg, mode, number):
+    if mode not in reg["access"]:
+        raise SequenceError(f"Step {number}: '{reg['name']}' is not {'writable' if mode == 'W' else 'readable'}.")
+
+
+def _write_values(reg, index, value, number):
+    if value is None:
+        raise SequenceError(f"Step {number}: write needs a 'value'.")
+    values = value if isinstance(value, list) else [value]
+    expected = 1 if index is not None else reg["length"]
+    if len(values) != expected:
+        raise SequenceError(f"Step {number}: '{reg['name']}' expects {expected} value(s), got {len(values)}.")
+    return [_as_float(v, number, "value") for v in values]
+
+
+def _conditions(raw, number, field, optional):
+    if raw is None and optional:
+        return {}
+    if not isinstance(raw, dict) or not raw:
+        raise SequenceError(f"Step {number}: '{field}' must be a mapping like {{ge: 10}}.")
+    conditions = {}
+    for op, value in raw.items():
+        if op not in CONDITION_OPS:
+            raise SequenceError(f"Step {number}: unknown condition '{op}' (use {', '.join(CONDITION_OPS)}).")
+        conditions[op] = _as_float(value, number, field)
+    return conditions
+
+
+def _optional_float(raw, key, number, default=None):
+    if key not in raw:
+        return default
+    return _as_float(raw[key], number, key)
+
+
+def _as_float(value, number, field):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise SequenceError(f"Step {number}: '{field}' must be a number, got {value!r}.")
+
+
+def check_conditions(value, conditions):
+    """Return the list of failed conditions as ``op value`` strings."""
+    return [f"{op} {limit:g}" for op, limit in conditions.items() if not CONDITION_OPS[op](value, limit)]
+
+
+class SequenceRunner:
+    """Run compiled steps using synchronous bus callables.
+
+    ``read(reg)`` returns the decoded values of the whole register entry or
+    ``None``; ``write(reg, index, values)`` returns ``None`` on success or an
+    error message.
+
+    ``run_iter`` is a generator that performs one bus transaction per
+    resumption and yields the number of seconds to pause before it is
+    resumed (``0`` after every step and ``wait`` attempt). The serial worker
+    drives it one task at a time, so other requests can be served between
+    steps and ``sleep``/``interval`` pauses never hold the worker. ``run``
+    drives it synchronously. Pauses end early when ``stop_event`` is set.
+    """
+
+    def __init__(self, steps, read, write, name="", stop_on_fail=True,
+                 stop_event=None, on_step=None, clock=time.perf_counter):
+        self.steps = steps
+        self._read = read
+        self._write = write
+        self.name = name
+        self.stop_on_fail = stop_on_fail
+        self.stop_event = stop_event
+        self._on_step = on_step
+        self._clock = clock
+        self.results = []
+        self._started_at = None
+        self._t0 = None
+
+    def run(self):
+        """Run all steps on the calling thread and return the report."""
+        steps = self.run_iter()
+        while True:
+            try:
+                delay = next(steps)
+            except StopIteration as done:
+                return done.value
+            if delay > 0:
+                self.pause(delay)
+
+    def pause(self, seconds):
+        """Sleep for ``seconds``, returning early when the stop event is set."""
+        if self.stop_event is not None:
+            self.stop_event.wait(seconds)
+        else:
+            time.sleep(seconds)
+
+    def _stopped(self):
+        return self.stop_event is not None and self.stop_event.is_set()
+
+    def run_iter(self):
+        self._started_at = datetime.now().isoformat(timespec="seconds")
+        self._t0 = self._clock()
+        self.results = results = []
+        halted = None
+        for step in self.steps:
+            if halted is None and self._stopped():
+                halted = "aborted"
+            if halted is not None:
+                results.append(self._result(step, "skipped", 0.0, message=halted))
+                continue
+
+            begin = self._clock()
+            try:
+                outcome = getattr(self, f"_run_{step['action']}")(step)
+                if isinstance(outcome, types.GeneratorType):  # sleep / wait は途中で一時停止する
+                    outcome = yield from outcome
+                status, value, message, attempts = outcome
+            except Exception as e:
+                status, value, message, attempts = "error", None, str(e), None
+            latency_ms = (self._clock() - begin) * 1000
+            if status == "pass" and step["max_ms"] is not None and latency_ms > step["max_ms"]:
+                status = "fail"
+                message = f"latency {latency_ms:.1f} ms > max_ms {step['max_ms']:g}"
+
+            result = self._result(step, status, latency_ms, value, message, attempts)
+            results.append(result)
+            if self._on_step is not None:
+                self._on_step(result)
+            if status != "pass" and self.stop_on_fail:
+                halted = f"stopped after step {step['number']}"
+            yield 0
+
+        return self.report()
+
+    def report(self, error=None):
+        """Build the report from the steps run so far.
+
+        ``error`` records why the run ended early (e.g. an unexpected
+        exception while driving ``run_iter``) and marks the report failed.
+        """
+        results = self.results
+        report = {
+            "name": self.name,
+            "started_at": self._started_at,
+            "total_ms": round((self._clock() - self._t0) * 1000, 3) if self._t0 is not None else 0.0,
+            "passed": error is None and all(r["status"] == "pass" for r in results),
+            "counts": {
+                status: sum(1 for r in results if r["status"] == status)
+                for status in ("pass", "fail", "error", "skipped")
+            },
+            "steps": results,
+        }
+        if error is not None:
+            report["error"] = error
+        return report
+
+    @staticmethod
+    def _result(step, status, latency_ms, value=None, message="", attempts=None):
+        result = {
+            "step": step["number"],
+            "label": step["label"],
+            "action": step["action"],
+            "target": step.get("target", ""),
+            "status": status,
+            "latency_ms": round(latency_ms, 3),
+            "value": value,
+            "message": message,
+        }
+        if attempts is not None:
+            result["attempts"] = attempts
+        return result
+
+    def _read_value(self, step):
+        values = self._read(step["reg"])
+        if values is None:
+            return None
+        if step["index"] is not None:
+            return values[step["index"]]
+        return values[0] if len(values) == 1 else list(values)
+
+    def _run_sleep(self, step):
+        yield step["seconds"]
+        if self._stopped():
+            return "fail", None, "aborted", None
+        return "pass", None, "", None
+
+    def _run_write(self, step):
+        error = self._write(step["reg"], step["index"], step["values"])
+        if error:
+            return "fail", step["values"], error, None
+        return "pass", step["values"], "", None
+
+    def _run_read(self, step):
+        value = self._read_value(step)
+        if value is None:
+            return "fail", None, "No Response", None
+        if step["expect"]:
+            if isinstance(value, list):
+                return "error", value, "expect needs a single element (use NAME[i])", None
+            failed = check_conditions(value, step["expect"])
+            if failed:
+                return "fail", value, "expected " + ", ".join(failed), None
+        return "pass", value, "", None
+
+    def _run_wait(self, step):
+        deadline = self._clock() + step["timeout"]
+        attempts = 0
+        value = None
+        while True:
+            attempts += 1
+            value = self._read_value(step)
+            if isinstance(value, list):
+                return "error", value, "wait needs a single element (use NAME[i])", attempts
+            if value is not None and not check_conditions(value, step["until"]):
+                return "pass", value, "", attempts
+            if self._clock() >= deadline:
+                return "fail", value, f"timeout after {step['timeout']:g} s", attempts
+            if self._stopped():
+                return "fail", value, "aborted", attempts
+            # 待機中も他の要求を通すため、読み出しごとにワーカーを手放す
+            yield min(step["interval"], max(0.0, deadline - self._clock()))
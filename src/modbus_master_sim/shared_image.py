@@ -0,0 +1,315 @@
+"""Shared-memory image of live polled values.
+
+RegiStar publishes the latest decoded value, timestamp and status of every
+pollable register element into a ``multiprocessing.shared_memory`` block so
+that other local processes can watch the bus without opening the serial port.
+This module only depends on the standard library; readers can import it
+without Tk, pyserial or pandas::
+
+    from modbus_master_sim.shared_image import SharedPollImageReader
+
+    with SharedPollImageReader("registar_poll") as image:
+        sample = image.read("TEMP")
+        print(sample.value, sample.timestamp, sample.status)
+
+Block layout (little endian)::
+
+    header      magic "RGSM", version, name field size, slot_count,
+                descriptor/slot offsets, owner pid,
+                generation counter (bumped on every publish)
+    descriptors slot_count x (name utf-8[name size], addr u32, type u8)
+    slots       slot_count x (seq u32, status u8, timestamp f64, value f64)
+
+The name field is sized from the longest element name, so names are never
+truncated. Each slot is guarded by its own seqlock: the writer makes ``seq``
+odd while updating and even again when done, and readers retry until they
+observe the same even ``seq`` before and after copying the slot.
+"""
+
+import os
+import struct
+import time
+from collections import Counter, namedtuple
+from multiprocessing import shared_memory
+
+DEFAULT_NAME = "registar_poll"
+
+MAGIC = b"RGSM"
+VERSION = 2
+
+STATUS_EMPTY = 0
+STATUS_OK = 1
+STATUS_NO_RESPONSE = 2
+
+TYPE_CODES = {"uint16_t": 1, "uint32_t": 2, "float": 3}
+TYPE_NAMES = {code: typ for typ, code in TYPE_CODES.items()}
+
+_HEADER = struct.Struct("<4sHHIIII8x")
+_LAYOUT_HEADER_SIZE = 20  # owner pid より前（レイアウトを決めるフィールド）
+_OWNER_PID = struct.Struct("<I")
+_GENERATION = struct.Struct("<Q")
+_GENERATION_OFFSET = _HEADER.size
+_DESCRIPTORS_OFFSET = _GENERATION_OFFSET + _GENERATION.size
+_SEQ = struct.Struct("<I")
+_SLOT = struct.Struct("<IB3xdd")
+_SLOT_BODY = struct.Struct("<B3xdd")
+
+_READ_RETRIES = 1000
+
+Sample = namedtuple("Sample", ["value", "timestamp", "status"])
+
+_owned_blocks = set()  # このプロセスの書き手が所有するブロック名
+
+
+def build_layout(reg_table):
+    """Return ``(name, addr, type)`` per pollable element of ``reg_table``.
+
+    The order matches the polling panel: R/RW registers in table order, one
+    element per array index, named ``NAME[i]`` for arrays.
+    """
+    layout = []
+    for reg in reg_table:
+        if reg.get("access") not in ["R", "RW"]:
+            continue
+        reg_len = reg.get("length", 1)
+        typ = reg.get("type", "uint16_t")
+        word_size = 2 if typ in ["float", "uint32_t"] else 1
+        for index in range(reg_len):
+            name = f"{reg['name']}[{index}]" if reg_len > 1 else reg["name"]
+            layout.append((name, reg["addr"] + index * word_size, typ))
+    return layout
+
+
+def _descriptor_struct(name_size):
+    return struct.Struct(f"<{name_size}sIB3x")
+
+
+class SharedPollImage:
+    """Writer side: owns the block and publishes decoded poll results.
+
+    Only one thread (the serial worker) may call ``publish``. Raises
+    ``FileExistsError`` when ``name`` is held by a live RegiStar instance or
+    by a foreign block, and ``ValueError`` when element names are not unique.
+    """
+
+    def __init__(self, reg_table, name=DEFAULT_NAME):
+        layout = build_layout(reg_table)
+        duplicates = sorted(n for n, count in Counter(n for n, _, _ in layout).items() if count > 1)
+        if duplicates:
+            raise ValueError(f"Duplicate element names in register map: {', '.join(duplicates)}")
+
+        encoded = [elem_name.encode("utf-8") for elem_name, _, _ in layout]
+        name_size = max([4] + [(len(raw) + 3) // 4 * 4 for raw in encoded])
+        descriptor = _descriptor_struct(name_size)
+        self._slot_offset = _DESCRIPTORS_OFFSET + len(layout) * descriptor.size
+        self._slots = {}  # (addr, name) -> 先頭スロット番号
+
+        # ヘッダ（owner pid 以前）と要素表はレイアウトだけで決まる
+        table = bytearray(self._slot_offset)
+        _HEADER.pack_into(
+            table, 0, MAGIC, VERSION, name_size, len(layout), _DESCRIPTORS_OFFSET, self._slot_offset, 0,
+        )
+        for pos, (raw, (_, addr, typ)) in enumerate(zip(encoded, layout)):
+            descriptor.pack_into(table, _DESCRIPTORS_OFFSET + pos * descriptor.size, raw, addr, TYPE_CODES.get(typ, 0))
+
+        self._shm, adopted = _open_block(name, self._slot_offset + len(layout) * _SLOT.size, table)
+        self.name = name
+        _owned_blocks.add(self._shm._name)
+
+        buf = self._shm.buf
+        if not adopted:
+            buf[:self._slot_offset] = table
+            _GENERATION.pack_into(buf, _GENERATION_OFFSET, 0)
+        now = time.time()
+        for pos in range(len(layout)):
+            _write_slot(buf, self._slot_offset + pos * _SLOT.size, STATUS_EMPTY, now if adopted else 0.0, 0.0)
+        _OWNER_PID.pack_into(buf, _LAYOUT_HEADER_SIZE, os.getpid())
+
+        pos = 0
+        for reg in reg_table:
+            if reg.get("access") not in ["R", "RW"]:
+                continue
+            self._slots[(reg["addr"], reg["name"])] = pos
+            pos += reg.get("length", 1)
+
+    def publish(self, reg, values):
+        """Store decoded ``values`` for ``reg``; ``None`` marks no response."""
+        first = self._slots.get((reg["addr"], reg["name"]))
+        if first is None:
+            return
+        buf = self._shm.buf
+        now = time.time()
+        for index in range(reg.get("length", 1)):
+            offset = self._slot_offset + (first + index) * _SLOT.size
+            if values is None or index >= len(values):
+                value = _SLOT_BODY.unpack_from(buf, offset + _SEQ.size)[2]
+                _write_slot(buf, offset, STATUS_NO_RESPONSE, now, value)
+            else:
+                _write_slot(buf, offset, STATUS_OK, now, float(values[index]))
+        generation = _GENERATION.unpack_from(buf, _GENERATION_OFFSET)[0]
+        _GENERATION.pack_into(buf, _GENERATION_OFFSET, generation + 1)
+
+    def close(self):
+        _owned_blocks.discard(self._shm._name)
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            unregistered = False
+        else:
+            # track=False で開いたブロック（3.13 以降の引き継ぎ）は unlink が登録を外さない
+            unregistered = getattr(self._shm, "_track", True)
+        if os.name == "posix" and not unregistered:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+
+
+def _write_slot(buf, offset, status, timestamp, value):
+    seq = _SEQ.unpack_from(buf, offset)[0]
+    _SEQ.pack_into(buf, offset, (seq + 1) & 0xFFFFFFFF)
+    _SLOT_BODY.pack_into(buf, offset + _SEQ.size, status, timestamp, value)
+    _SEQ.pack_into(buf, offset, (seq + 2) & 0xFFFFFFFF)
+
+
+def _open_block(name, size, table):
+    """Create block ``name``, or reclaim it if it provably belongs to a dead writer.
+
+    Returns ``(shm, adopted)``. A stale block with the same layout is adopted
+    in place so that readers still attached to it keep working; a stale
+    block with a different layout is recreated where the platform allows.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, create=True, size=size), False
+    except FileExistsError:
+        pass
+
+    existing = _attach(name)
+    buf = existing.buf
+    hint = "start RegiStar with --shm OTHERNAME to use a different block"
+    if len(buf) < _HEADER.size or bytes(buf[:4]) != MAGIC:
+        existing.close()
+        raise FileExistsError(f"Shared memory '{name}' exists and is not a RegiStar poll image; {hint}.")
+    owner = _OWNER_PID.unpack_from(buf, _LAYOUT_HEADER_SIZE)[0]
+    if owner != os.getpid() and _pid_alive(owner):
+        existing.close()
+        raise FileExistsError(f"Shared memory '{name}' is in use by RegiStar (pid {owner}); {hint}.")
+
+    if len(buf) >= size and bytes(buf[:_LAYOUT_HEADER_SIZE]) == bytes(table[:_LAYOUT_HEADER_SIZE]) \
+            and bytes(buf[_DESCRIPTORS_OFFSET:len(table)]) == bytes(table[_DESCRIPTORS_OFFSET:]):
+        _track(existing)
+        return existing, True
+
+    existing.close()
+    try:
+        existing.unlink()  # Windows では何もしない
+    except FileNotFoundError:
+        pass
+    try:
+        return shared_memory.SharedMemory(name=name, create=True, size=size), False
+    except FileExistsError:
+        raise FileExistsError(
+            f"Shared memory '{name}' from an earlier run is still open in a reader with a different "
+            f"register layout; close the reader or {hint}."
+        )
+
+
+def _pid_alive(pid):
+    if pid <= 0:
+        return False
+    if os.name == "nt":
+        # Windows の os.kill(pid, 0) はプロセスを終了させてしまうため使えない
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        try:
+            code = ctypes.c_ulong()
+            return bool(kernel32.GetExitCodeProcess(handle, ctypes.byref(code))) and code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedPollImageReader:
+    """Reader side: attaches to a published block by name."""
+
+    def __init__(self, name=DEFAULT_NAME):
+        self._shm = _attach(name)
+        buf = self._shm.buf
+        magic, version, name_size, slot_count, desc_offset, slot_offset, _ = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            self._shm.close()
+            raise ValueError(f"{name!r} is not a RegiStar poll image (version {VERSION})")
+        descriptor = _descriptor_struct(name_size)
+        self._slot_offset = slot_offset
+        self.layout = []
+        self._index = {}
+        for pos in range(slot_count):
+            raw_name, addr, type_code = descriptor.unpack_from(buf, desc_offset + pos * descriptor.size)
+            elem_name = raw_name.rstrip(b"\0").decode("utf-8")
+            self.layout.append((elem_name, addr, TYPE_NAMES.get(type_code, "")))
+            self._index[elem_name] = pos
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    @property
+    def generation(self):
+        """Counter bumped by every publish; cheap change detection."""
+        return _GENERATION.unpack_from(self._shm.buf, _GENERATION_OFFSET)[0]
+
+    def names(self):
+        return [elem_name for elem_name, _, _ in self.layout]
+
+    def read(self, name):
+        """Return a consistent ``Sample`` for element ``name``."""
+        return self.read_slot(self._index[name])
+
+    def read_slot(self, pos):
+        buf = self._shm.buf
+        offset = self._slot_offset + pos * _SLOT.size
+        for _ in range(_READ_RETRIES):
+            before, status, timestamp, value = _SLOT.unpack_from(buf, offset)
+            if before & 1:
+                continue
+            if _SEQ.unpack_from(buf, offset)[0] == before:
+                return Sample(value, timestamp, status)
+        raise TimeoutError(f"slot {pos} kept changing while being read")
+
+    def read_all(self):
+        """Return ``{name: Sample}`` for every element."""
+        return {elem_name: self.read_slot(pos) for pos, (elem_name, _, _) in enumerate(self.layout)}
+
+    def close(self):
+        self._shm.close()
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: 読み手側でもresource_trackerに登録され、終了時に
+        # ブロックが削除されてしまうため登録を外す
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == "posix" and shm._name not in _owned_blocks:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def _track(shm):
+    """Register an adopted block like a created one; ``close`` unregisters it."""
+    if os.name == "posix":
+        from multiprocessing import resource_tracker
+        resource_tracker.register(shm._name, "shared_memory")
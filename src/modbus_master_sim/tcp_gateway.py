@@ -0,0 +1,297 @@
+"""Caching Modbus TCP gateway in front of the RTU bus.
+
+``ModbusTcpGateway`` answers FC03 reads from ``RegisterCache`` (filled by
+polling and every other FC03 read on the bus) while the cached words are
+younger than ``max_age`` seconds, and falls through to a real bus read
+otherwise. Identical concurrent fall-through reads are coalesced into one bus
+transaction. FC06/FC16 writes are forwarded to the bus and invalidate the
+written words in the cache.
+
+Bus access is injected as callables taking a ``done(resp)`` callback that
+receives the raw RTU response frame (or ``None``) from any thread::
+
+    read(unit, addr, count, done)
+    write_single(unit, addr, value, done, claim)
+    write_multi(unit, addr, values, done, claim)
+
+Writes must call ``claim()`` right before sending and skip the write when
+it returns False: the gateway has then already answered the client with
+exception 0x0B, so a write reported as failed never reaches the bus later.
+
+This module only depends on the standard library, so the gateway can be
+exercised entirely on loopback with a fake bus.
+"""
+
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 5020  # 502 は特権ポートのため一般ユーザーでも開ける番号を既定にする
+DEFAULT_MAX_AGE = 1.0
+DEFAULT_TIMEOUT = 5.0
+
+EX_ILLEGAL_FUNCTION = 0x01
+EX_ILLEGAL_DATA_VALUE = 0x03
+EX_TARGET_NO_RESPONSE = 0x0B
+
+MAX_READ_COUNT = 125
+MAX_WRITE_COUNT = 123
+
+_MBAP = struct.Struct(">HHHB")
+
+
+class RegisterCache:
+    """Latest known value and receive time of every holding register word."""
+
+    def __init__(self, clock=time.monotonic):
+        self._words = {}  # (unit, addr) -> (word bytes, timestamp)
+        self._lock = threading.Lock()
+        self._clock = clock
+
+    def store(self, unit, addr, data):
+        """Store big-endian register ``data`` read from ``addr`` onwards."""
+        now = self._clock()
+        with self._lock:
+            for i in range(len(data) // 2):
+                self._words[(unit, (addr + i) & 0xFFFF)] = (bytes(data[i * 2:i * 2 + 2]), now)
+
+    def lookup(self, unit, addr, count, max_age):
+        """Return ``count`` words as bytes if all are cached and fresh, else None."""
+        oldest = self._clock() - max_age
+        chunks = []
+        with self._lock:
+            for i in range(count):
+                entry = self._words.get((unit, (addr + i) & 0xFFFF))
+                if entry is None or entry[1] < oldest:
+                    return None
+                chunks.append(entry[0])
+        return b"".join(chunks)
+
+    def invalidate(self, unit, addr, count):
+        with self._lock:
+            for i in range(count):
+                self._words.pop((unit, (addr + i) & 0xFFFF), None)
+
+
+class _Pending:
+    __slots__ = ("event", "result", "_state", "_lock")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self._state = "queued"
+        self._lock = threading.Lock()
+
+    def resolve(self, result):
+        self.result = result
+        self.event.set()
+
+    def claim(self):
+        """Mark the request as sent; False when the gateway already gave up."""
+        with self._lock:
+            if self._state == "cancelled":
+                return False
+            self._state = "claimed"
+            return True
+
+    def cancel(self):
+        """Give up on a request that has not been sent; False if it already was."""
+        with self._lock:
+            if self._state == "claimed":
+                return False
+            self._state = "cancelled"
+            return True
+
+
+class ModbusTcpGateway:
+    """Threaded Modbus TCP server answering from the cache or the RTU bus."""
+
+    def __init__(self, cache, read, write_single, write_multi, host=DEFAULT_HOST, port=DEFAULT_PORT,
+                 max_age=DEFAULT_MAX_AGE, timeout=DEFAULT_TIMEOUT, resolve_unit=None):
+        self.cache = cache
+        self._bus_read = read
+        self._bus_write_single = write_single
+        self._bus_write_multi = write_multi
+        self.max_age = max_age
+        self.timeout = timeout
+        self._resolve_unit = resolve_unit or (lambda unit: unit)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {"cache_hits": 0, "bus_reads": 0, "coalesced": 0, "writes": 0, "errors": 0}
+
+        self._server = _GatewayServer((host, port), _GatewayHandler)
+        self._server.gateway = self
+        self._thread = None
+
+    @property
+    def address(self):
+        """``(host, port)`` actually bound (useful with ``port=0``)."""
+        return self._server.server_address[:2]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="tcp_gateway", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def handle_pdu(self, unit, pdu):
+        """Return the response PDU for request ``pdu`` addressed to ``unit``."""
+        if not pdu:
+            return _exception(0x00, EX_ILLEGAL_FUNCTION)
+        unit = self._resolve_unit(unit)
+        func = pdu[0]
+        if func == 0x03:
+            return self._read_holding(unit, pdu)
+        if func == 0x06:
+            return self._write_single(unit, pdu)
+        if func == 0x10:
+            return self._write_multiple(unit, pdu)
+        return _exception(func, EX_ILLEGAL_FUNCTION)
+
+    def _read_holding(self, unit, pdu):
+        if len(pdu) != 5:
+            return _exception(0x03, EX_ILLEGAL_DATA_VALUE)
+        addr, count = struct.unpack(">HH", pdu[1:5])
+        if not 1 <= count <= MAX_READ_COUNT:
+            return _exception(0x03, EX_ILLEGAL_DATA_VALUE)
+
+        data = self.cache.lookup(unit, addr, count, self.max_age)
+        if data is not None:
+            self._count("cache_hits")
+            return bytes([0x03, len(data)]) + data
+
+        resp = self._coalesced_read(unit, addr, count)
+        error = _rtu_error(0x03, resp)
+        if error is not None:
+            return error
+        data = bytes(resp[3:3 + resp[2]])
+        if len(data) != count * 2:
+            self._count("errors")
+            return _exception(0x03, EX_TARGET_NO_RESPONSE)
+        self.cache.store(unit, addr, data)
+        return bytes([0x03, len(data)]) + data
+
+    def _coalesced_read(self, unit, addr, count):
+        key = (unit, addr, count)
+        with self._lock:
+            pending = self._inflight.get(key)
+            leader = pending is None
+            if leader:
+                pending = _Pending()
+                self._inflight[key] = pending
+                self.stats["bus_reads"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if leader:
+            def done(resp):
+                with self._lock:
+                    if self._inflight.get(key) is pending:
+                        del self._inflight[key]
+                pending.resolve(resp)
+            self._bus_read(unit, addr, count, done)
+
+        if not pending.event.wait(self.timeout):
+            with self._lock:
+                if self._inflight.get(key) is pending:
+                    del self._inflight[key]
+            return None
+        return pending.result
+
+    def _write_single(self, unit, pdu):
+        if len(pdu) != 5:
+            return _exception(0x06, EX_ILLEGAL_DATA_VALUE)
+        addr, value = struct.unpack(">HH", pdu[1:5])
+        resp = self._call(self._bus_write_single, unit, addr, value)
+        self.cache.invalidate(unit, addr, 1)
+        error = _rtu_error(0x06, resp)
+        if error is not None:
+            return error
+        self._count("writes")
+        return bytes(pdu)
+
+    def _write_multiple(self, unit, pdu):
+        if len(pdu) < 6:
+            return _exception(0x10, EX_ILLEGAL_DATA_VALUE)
+        addr, count, byte_count = struct.unpack(">HHB", pdu[1:6])
+        if not 1 <= count <= MAX_WRITE_COUNT or byte_count != count * 2 or len(pdu) != 6 + byte_count:
+            return _exception(0x10, EX_ILLEGAL_DATA_VALUE)
+        values = struct.unpack(">" + "H" * count, pdu[6:6 + byte_count])
+        resp = self._call(self._bus_write_multi, unit, addr, list(values))
+        self.cache.invalidate(unit, addr, count)
+        error = _rtu_error(0x10, resp)
+        if error is not None:
+            return error
+        self._count("writes")
+        return struct.pack(">BHH", 0x10, addr, count)
+
+    def _call(self, func, *args):
+        pending = _Pending()
+        func(*args, pending.resolve, pending.claim)
+        if pending.event.wait(self.timeout):
+            return pending.result
+        if pending.cancel():
+            return None  # まだ送信されていないので、キューに残った書き込みは捨てられる
+        # 送信が始まった書き込みは結果を待ってから応答する
+        if not pending.event.wait(self.timeout):
+            return None
+        return pending.result
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+
+def _exception(func, code):
+    return bytes([(func | 0x80) & 0xFF, code])
+
+
+def _rtu_error(func, resp):
+    """Map a failed RTU response to an exception PDU; None when ``resp`` is usable."""
+    if not resp or len(resp) < 3:
+        return _exception(func, EX_TARGET_NO_RESPONSE)
+    if resp[1] & 0x80:
+        return _exception(func, resp[2])
+    return None
+
+
+class _GatewayServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class _GatewayHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        gateway = self.server.gateway
+        sock = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        while True:
+            header = _recv_exact(sock, _MBAP.size)
+            if header is None:
+                return
+            transaction_id, protocol_id, length, unit = _MBAP.unpack(header)
+            if protocol_id != 0 or not 2 <= length <= 254:
+                return
+            pdu = _recv_exact(sock, length - 1)
+            if pdu is None:
+                return
+            resp = gateway.handle_pdu(unit, pdu)
+            sock.sendall(_MBAP.pack(transaction_id, 0, len(resp) + 1, unit) + resp)
+
+
+def _recv_exact(sock, size):
+    buf = b""
+    while len(buf) < size:
+        try:
+            chunk = sock.recv(size - len(buf))
+        except OSError:
+            return None
+        if not chunk:
+            return None
+        buf += chunk
+    return buf
@@ -0,0 +1,132 @@
+import threading
+import time
+
+from modbus_master_sim.lanes import LANE_BULK, LANE_INTERACTIVE, LANE_POLL, LaneTaskQueue
+
+
+def drain(queue):
+    items = []
+    while queue.qsize():
+        items.append(queue.get())
+        queue.task_done()
+    return items
+
+
+def test_lanes_are_served_in_priority_order():
+    queue = LaneTaskQueue()
+    queue.put("bulk", LANE_BULK)
+    queue.put("poll-1", LANE_POLL)
+    queue.put("click-1", LANE_INTERACTIVE)
+    queue.put("poll-2", LANE_POLL)
+    queue.put("click-2")
+    assert queue.qsize() == 5
+    assert queue.qsize(LANE_POLL) == 2
+    assert drain(queue) == ["click-1", "click-2", "poll-1", "poll-2", "bulk"]
+
+
+def test_keyed_item_replaces_pending_one_in_place():
+    queue = LaneTaskQueue()
+    queue.put("a-old", LANE_POLL, key="a")
+    queue.put("b", LANE_POLL, key="b")
+    queue.put("a-new", LANE_POLL, key="a")
+    assert queue.qsize() == 2
+    assert queue.dropped == 1
+    assert drain(queue) == ["a-new", "b"]
+
+    # once taken by the worker the key is free again
+    queue.put("a-next", LANE_POLL, key="a")
+    assert queue.dropped == 1
+    assert drain(queue) == ["a-next"]
+
+
+def test_join_waits_for_task_done_of_every_item():
+    queue = LaneTaskQueue()
+    queue.put("x")
+    queue.put("y", LANE_POLL, key="k")
+    queue.put("y2", LANE_POLL, key="k")  # replaced items are not counted twice
+    finished = threading.Event()
+
+    def joiner():
+        queue.join()
+        finished.set()
+
+    threading.Thread(target=joiner, daemon=True).start()
+    queue.get()
+    queue.task_done()
+    assert not finished.wait(0.05)
+    queue.get()
+    queue.task_done()
+    assert finished.wait(1)
+
+
+def test_get_blocks_until_an_item_arrives():
+    queue = LaneTaskQueue()
+    got = []
+    thread = threading.Thread(target=lambda: got.append(queue.get()), daemon=True)
+    thread.start()
+    time.sleep(0.05)
+    assert got == []
+    queue.put("late", LANE_BULK)
+    thread.join(1)
+    assert got == ["late"]
+
+
+def test_bulk_lane_gets_a_turn_while_poll_lane_keeps_refilling():
+    queue = LaneTaskQueue(starve_limit=3)
+    for i in range(3):
+        queue.put(f"poll-{i}", LANE_POLL, key=i)
+    queue.put("step-1", LANE_BULK)
+
+    served = []
+    for _ in range(8):
+        served.append(queue.get())
+        queue.task_done()
+        if served[-1].startswith("poll"):
+            n = int(served[-1].split("-")[1])
+            queue.put(f"poll-{n}", LANE_POLL, key=n)  # poll set never drains
+        elif served[-1] == "step-1":
+            queue.put("step-2", LANE_BULK)
+    assert served == ["poll-0", "poll-1", "poll-2", "step-1", "poll-0", "poll-1", "poll-2", "step-2"]
+
+
+def test_interactive_lane_is_never_passed_over():
+    queue = LaneTaskQueue(starve_limit=1)
+    queue.put("step", LANE_BULK)
+    queue.put("poll", LANE_POLL)
+    for i in range(3):
+        queue.put(f"click-{i}")
+    assert drain(queue) == ["click-0", "click-1", "click-2", "step", "poll"]
+
+
+def test_bulk_task_runs_while_a_slow_poll_set_outpaces_its_interval():
+    queue = LaneTaskQueue()
+    stop = threading.Event()
+    bulk_done = threading.Event()
+
+    def worker():
+        while not stop.is_set():
+            func = queue.get()
+            try:
+                func()
+            finally:
+                queue.task_done()
+
+    def poller():
+        # 20 keyed reads of 5 ms re-queued every 50 ms: the poll lane never empties
+        while not stop.is_set():
+            for i in range(20):
+                queue.put(lambda: time.sleep(0.005), LANE_POLL, key=("poll", i))
+            time.sleep(0.05)
+
+    threading.Thread(target=worker, daemon=True).start()
+    threading.Thread(target=poller, daemon=True).start()
+    try:
+        time.sleep(0.1)
+        started = time.perf_counter()
+        queue.put(bulk_done.set, LANE_BULK)
+        assert bulk_done.wait(2)
+        assert time.perf_counter() - started < 0.5
+        assert queue.qsize(LANE_POLL) > 0  # polling was still running
+    finally:
+        stop.set()
+        queue.put(lambda: None)
@@ -0,0 +1,67 @@
+import pytest
+
+from modbus_master_sim.register_search import RegisterIndex, parse_search_query
+
+ITEMS = [
+    ("TEMP", 100, "float", "R"),
+    ("TEMP10", 102, "float", "R"),
+    ("X1", 1, "uint16_t", "RW"),
+    ("AI1", 40, "uint16_t", "R"),
+    ("SETPOINT", 200, "uint32_t", "RW"),
+    ("MODE", 10, "uint16_t", "W"),
+]
+
+
+@pytest.fixture
+def index():
+    return RegisterIndex(ITEMS)
+
+
+def names(positions):
+    return [ITEMS[pos][0] for pos in positions]
+
+
+def test_parse_splits_terms_numbers_and_facets():
+    query = parse_search_query("Temp 0x10-0x1F type:float access:rw addr:100-90")
+    assert query.terms == ["temp"]
+    assert query.numbers == [("0x10-0x1f", (16, 31))]
+    assert query.facets == {"type": "float", "access": "RW"}
+    assert query.addr_range == (90, 100)
+
+
+def test_parse_ignores_invalid_addr_prefix():
+    query = parse_search_query("addr:abc")
+    assert query.addr_range is None
+    assert query.terms == []
+
+
+def test_empty_query_returns_everything(index):
+    assert index.search("   ") == list(range(len(ITEMS)))
+
+
+def test_name_substring_is_case_insensitive(index):
+    assert names(index.search("temp")) == ["TEMP", "TEMP10"]
+    assert names(index.search("point")) == ["SETPOINT"]
+
+
+def test_bare_number_matches_address_or_name(index):
+    assert names(index.search("1")) == ["TEMP10", "X1", "AI1"]
+    assert names(index.search("10")) == ["TEMP10", "MODE"]
+
+
+def test_bare_range_matches_address_or_name(index):
+    assert names(index.search("100-150")) == ["TEMP", "TEMP10"]
+    assert names(index.search("0x28")) == ["AI1"]
+
+
+def test_addr_prefix_matches_address_only(index):
+    assert names(index.search("addr:1")) == ["X1"]
+    assert names(index.search("addr:100-200")) == ["TEMP", "TEMP10", "SETPOINT"]
+
+
+def test_facets_and_terms_are_anded(index):
+    assert names(index.search("type:uint access:RW")) == ["X1", "SETPOINT"]
+    assert names(index.search("temp addr:102")) == ["TEMP10"]
+    assert names(index.search("1 type:float")) == ["TEMP10"]
+    assert index.search("mode access:R") == []
+
@@ -0,0 +1,291 @@
+import json
+import threading
+
+import pytest
+
+from modbus_master_sim.sequence import (
+    SequenceError,
+    SequenceRunner,
+    check_conditions,
+    compile_sequence,
+    load_sequence,
+)
+
+REG_TABLE = [
+    {"name": "SETPOINT", "addr": 10, "type": "uint16_t", "length": 1, "access": "RW"},
+    {"name": "TEMP", "addr": 20, "type": "float", "length": 1, "access": "R"},
+    {"name": "PRESSURE", "addr": 30, "type": "float", "length": 3, "access": "R"},
+    {"name": "CMD", "addr": 40, "type": "uint16_t", "length": 2, "access": "W"},
+]
+REGS = {reg["name"]: reg for reg in REG_TABLE}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeDevice:
+    """Synchronous read/write callables over a dict of register values.
+
+    ``bus_time`` advances the fake clock for every transaction and
+    ``on_read`` lets a test change values between attempts.
+    """
+
+    def __init__(self, clock, values=None, bus_time=0.01):
+        self.clock = clock
+        self.values = {"SETPOINT": [0], "TEMP": [20.0], "PRESSURE": [1.0, 1.5, 2.5], "CMD": [0, 0]}
+        self.values.update(values or {})
+        self.bus_time = bus_time
+        self.reads = []
+        self.writes = []
+        self.on_read = None
+        self.fail_writes = None
+
+    def read(self, reg):
+        self.clock.now += self.bus_time
+        self.reads.append(reg["name"])
+        if self.on_read is not None:
+            self.on_read(self)
+        return self.values.get(reg["name"])
+
+    def write(self, reg, index, values):
+        self.clock.now += self.bus_time
+        self.writes.append((reg["name"], index, values))
+        if self.fail_writes:
+            return self.fail_writes
+        if index is None:
+            self.values[reg["name"]] = list(values)
+        else:
+            self.values[reg["name"]][index] = values[0]
+        return None
+
+
+def make_runner(steps, device, clock, **kwargs):
+    return SequenceRunner(compile_sequence({"steps": steps}, REG_TABLE), device.read, device.write,
+                          clock=clock, **kwargs)
+
+
+def drive(runner, clock):
+    """Run ``run_iter`` like the worker does, advancing the fake clock on pauses."""
+    steps = runner.run_iter()
+    pauses = []
+    while True:
+        try:
+            delay = next(steps)
+        except StopIteration as done:
+            return done.value, pauses
+        if delay > 0:
+            pauses.append(delay)
+            clock.now += delay
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def device(clock):
+    return FakeDevice(clock)
+
+
+# --- compile_sequence ---
+
+def test_compile_resolves_targets_and_defaults():
+    steps = compile_sequence({"steps": [
+        {"write": "SETPOINT", "value": 1200, "label": "start"},
+        {"wait": "TEMP", "until": {"ge": 50}},
+        {"read": " PRESSURE[ 2 ] ", "expect": {"le": 3}, "max_ms": 200},
+        {"write": "CMD", "value": [1, 2]},
+        {"sleep": 0.5},
+    ]}, REG_TABLE)
+    assert [s["action"] for s in steps] == ["write", "wait", "read", "write", "sleep"]
+    assert steps[0]["values"] == [1200.0] and steps[0]["label"] == "start"
+    assert steps[1]["timeout"] == 10.0 and steps[1]["interval"] == 0.0
+    assert steps[2]["reg"] is REGS["PRESSURE"] and steps[2]["index"] == 2
+    assert steps[2]["max_ms"] == 200.0 and steps[2]["expect"] == {"le": 3.0}
+    assert steps[3]["index"] is None and steps[3]["values"] == [1.0, 2.0]
+    assert steps[4]["seconds"] == 0.5
+
+
+@pytest.mark.parametrize("script, message", [
+    ([], "mapping with a 'steps' list"),
+    ({"steps": ["read TEMP"]}, "must be a mapping"),
+    ({"steps": [{"read": "TEMP", "sleep": 1}]}, "exactly one of"),
+    ({"steps": [{"read": "TMP"}]}, "unknown register 'TMP'"),
+    ({"steps": [{"read": "PRESSURE[3]"}]}, "index 3 out of range"),
+    ({"steps": [{"write": "TEMP", "value": 1}]}, "'TEMP' is not writable"),
+    ({"steps": [{"read": "CMD"}]}, "'CMD' is not readable"),
+    ({"steps": [{"write": "SETPOINT"}]}, "needs a 'value'"),
+    ({"steps": [{"write": "CMD", "value": 1}]}, "expects 2 value"),
+    ({"steps": [{"write": "CMD[1]", "value": [1, 2]}]}, "expects 1 value"),
+    ({"steps": [{"write": "SETPOINT", "value": "high"}]}, "'value' must be a number"),
+    ({"steps": [{"wait": "TEMP"}]}, "'until' must be a mapping"),
+    ({"steps": [{"read": "TEMP", "expect": {"gte": 1}}]}, "unknown condition 'gte'"),
+    ({"steps": [{"sleep": "long"}]}, "'sleep' must be a number"),
+    ({"steps": [{"read": "TEMP", "max_ms": None}]}, "'max_ms' must be a number"),
+])
+def test_compile_rejects_bad_scripts_with_step_number(script, message):
+    with pytest.raises(SequenceError, match=message.replace("[", r"\[")):
+        compile_sequence(script, REG_TABLE)
+
+
+def test_check_conditions_lists_failures():
+    assert check_conditions(5, {"ge": 1, "lt": 10}) == []
+    assert check_conditions(5, {"gt": 5, "ne": 5, "le": 9}) == ["gt 5", "ne 5"]
+
+
+def test_load_sequence_reads_json(tmp_path):
+    path = tmp_path / "seq.json"
+    path.write_text(json.dumps({"steps": [{"sleep": 1}]}), encoding="utf-8")
+    assert load_sequence(str(path)) == {"steps": [{"sleep": 1}]}
+    path.write_text("{oops", encoding="utf-8")
+    with pytest.raises(SequenceError, match="Invalid JSON"):
+        load_sequence(str(path))
+
+
+# --- SequenceRunner ---
+
+def test_passing_run_reports_each_step(device, clock):
+    seen = []
+    runner = make_runner([
+        {"write": "SETPOINT", "value": 7},
+        {"read": "SETPOINT", "expect": {"eq": 7}},
+        {"read": "PRESSURE"},
+        {"read": "PRESSURE[1]", "expect": {"ge": 1, "le": 2}},
+    ], device, clock, name="ok", on_step=seen.append)
+    report, pauses = drive(runner, clock)
+
+    assert report["passed"] is True
+    assert report["counts"] == {"pass": 4, "fail": 0, "error": 0, "skipped": 0}
+    assert [r["value"] for r in report["steps"]] == [[7.0], 7, [1.0, 1.5, 2.5], 1.5]
+    assert [r["latency_ms"] for r in report["steps"]] == [10.0] * 4
+    assert report["total_ms"] == 40.0
+    assert seen == report["steps"]
+    assert device.writes == [("SETPOINT", None, [7.0])]
+    assert pauses == []
+
+
+def test_run_iter_yields_once_per_step(device, clock):
+    runner = make_runner([{"read": "TEMP"}, {"read": "TEMP"}], device, clock)
+    assert list(runner.run_iter()) == [0, 0]
+
+
+def test_failure_stops_and_skips_remaining_steps(device, clock):
+    runner = make_runner([
+        {"read": "TEMP", "expect": {"gt": 50}},
+        {"write": "SETPOINT", "value": 1},
+    ], device, clock)
+    report, _ = drive(runner, clock)
+    first, second = report["steps"]
+    assert (first["status"], first["message"]) == ("fail", "expected gt 50")
+    assert (second["status"], second["message"]) == ("skipped", "stopped after step 1")
+    assert device.writes == []
+    assert report["passed"] is False
+
+
+def test_stop_on_fail_false_keeps_going(device, clock):
+    device.values["TEMP"] = None
+    runner = make_runner([{"read": "TEMP"}, {"read": "SETPOINT"}], device, clock, stop_on_fail=False)
+    report, _ = drive(runner, clock)
+    assert [(r["status"], r["message"]) for r in report["steps"]] == [("fail", "No Response"), ("pass", "")]
+
+
+def test_write_error_and_exception_are_reported(device, clock):
+    device.fail_writes = "Exception Response: Func=0x86, Code=0x02"
+    runner = make_runner([{"write": "SETPOINT", "value": 1}], device, clock)
+    report, _ = drive(runner, clock)
+    assert report["steps"][0]["status"] == "fail"
+    assert report["steps"][0]["message"].startswith("Exception Response")
+
+    def broken(reg):
+        raise RuntimeError("port closed")
+    runner = SequenceRunner(compile_sequence({"steps": [{"read": "TEMP"}]}, REG_TABLE), broken, device.write,
+                            clock=clock)
+    report, _ = drive(runner, clock)
+    assert (report["steps"][0]["status"], report["steps"][0]["message"]) == ("error", "port closed")
+
+
+def test_expect_on_whole_array_is_an_error(device, clock):
+    runner = make_runner([{"read": "PRESSURE", "expect": {"ge": 0}}], device, clock)
+    report, _ = drive(runner, clock)
+    assert report["steps"][0]["status"] == "error"
+
+
+def test_max_ms_turns_a_slow_pass_into_a_fail(clock):
+    device = FakeDevice(clock, bus_time=0.25)
+    runner = make_runner([{"read": "TEMP", "max_ms": 200}], device, clock)
+    report, _ = drive(runner, clock)
+    step = report["steps"][0]
+    assert step["status"] == "fail"
+    assert step["message"] == "latency 250.0 ms > max_ms 200"
+
+
+def test_wait_polls_at_interval_until_condition(device, clock):
+    def heat(dev):
+        dev.values["TEMP"] = [dev.values["TEMP"][0] + 10]
+    device.on_read = heat
+    runner = make_runner([{"wait": "TEMP", "until": {"ge": 50}, "interval": 0.5, "timeout": 10}], device, clock)
+    report, pauses = drive(runner, clock)
+    step = report["steps"][0]
+    assert (step["status"], step["value"], step["attempts"]) == ("pass", 50.0, 3)
+    assert pauses == [0.5, 0.5]
+
+
+def test_wait_times_out_without_overshooting_deadline(device, clock):
+    runner = make_runner([{"wait": "TEMP", "until": {"ge": 50}, "interval": 0.4, "timeout": 1}], device, clock)
+    report, pauses = drive(runner, clock)
+    step = report["steps"][0]
+    assert (step["status"], step["message"]) == ("fail", "timeout after 1 s")
+    assert step["attempts"] == 4
+    assert sum(pauses) <= 1.0 + 1e-9
+
+
+def test_sleep_pauses_and_abort_during_sleep(device, clock):
+    stop = threading.Event()
+    runner = make_runner([{"sleep": 2}, {"read": "TEMP"}], device, clock, stop_event=stop)
+    steps = runner.run_iter()
+    assert next(steps) == 2
+    stop.set()  # Stop pressed while sleeping
+    assert next(steps) == 0
+    with pytest.raises(StopIteration) as done:
+        next(steps)
+    report = done.value.value
+    assert [(r["status"], r["message"]) for r in report["steps"]] == [
+        ("fail", "aborted"), ("skipped", "stopped after step 1"),
+    ]
+    assert device.reads == []
+
+
+def test_abort_during_wait(device, clock):
+    stop = threading.Event()
+    runner = make_runner([{"wait": "TEMP", "until": {"ge": 50}, "interval": 0.1}], device, clock, stop_event=stop)
+    steps = runner.run_iter()
+    assert next(steps) == 0.1
+    stop.set()
+    clock.now += 0.1
+    assert next(steps) == 0
+    report = runner.report()
+    assert (report["steps"][0]["status"], report["steps"][0]["message"]) == ("fail", "aborted")
+    assert report["steps"][0]["attempts"] == 2
+
+
+def test_report_with_error_marks_run_failed(device, clock):
+    runner = make_runner([{"read": "TEMP"}, {"read": "TEMP"}], device, clock)
+    steps = runner.run_iter()
+    next(steps)
+    report = runner.report(error="RuntimeError: boom")
+    assert report["passed"] is False
+    assert report["error"] == "RuntimeError: boom"
+    assert report["counts"]["pass"] == 1
+
+
+def test_run_drives_pauses_synchronously(device, clock):
+    runner = make_runner([{"sleep": 0.01}, {"read": "TEMP"}], device, clock)
+    report = runner.run()
+    assert report["passed"] is True
+    assert report["counts"]["pass"] == 2
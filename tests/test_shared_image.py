@@ -0,0 +1,134 @@
+import os
+import subprocess
+import sys
+import textwrap
+import uuid
+
+import pytest
+
+from modbus_master_sim import shared_image
+from modbus_master_sim.shared_image import (
+    STATUS_EMPTY,
+    STATUS_NO_RESPONSE,
+    STATUS_OK,
+    SharedPollImage,
+    SharedPollImageReader,
+)
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="block lifetime differs on Windows")
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+REG_TABLE = [
+    {"name": "TEMP", "addr": 100, "type": "float", "length": 1, "access": "R"},
+    {"name": "SETPOINT", "addr": 110, "type": "uint16_t", "length": 1, "access": "W"},
+    {"name": "圧力センサー", "addr": 120, "type": "uint32_t", "length": 3, "access": "RW"},
+]
+
+
+@pytest.fixture
+def block_name():
+    return f"rgtest_{uuid.uuid4().hex[:12]}"
+
+
+@pytest.fixture
+def writer(block_name):
+    image = SharedPollImage(REG_TABLE, block_name)
+    yield image
+    image.close()
+
+
+def run_python(code):
+    return subprocess.run(
+        [sys.executable, "-c", textwrap.dedent(code)],
+        env={**os.environ, "PYTHONPATH": SRC},
+        capture_output=True,
+        text=True,
+        timeout=30,
+    )
+
+
+def leave_stale_block(name):
+    """Publish ``name`` from a child process that exits without cleaning up."""
+    result = run_python(f"""
+        import os
+        from multiprocessing import resource_tracker
+        from modbus_master_sim.shared_image import SharedPollImage
+        image = SharedPollImage({REG_TABLE!r}, {name!r})
+        image.publish({REG_TABLE[0]!r}, [21.5])
+        resource_tracker.unregister(image._shm._name, "shared_memory")
+        os._exit(0)
+    """)
+    assert result.returncode == 0, result.stderr
+
+
+def test_round_trip_and_status_values(writer, block_name):
+    with SharedPollImageReader(block_name) as reader:
+        assert reader.names() == ["TEMP", "圧力センサー[0]", "圧力センサー[1]", "圧力センサー[2]"]
+        assert [addr for _, addr, _ in reader.layout] == [100, 120, 122, 124]
+        assert reader.read("TEMP").status == STATUS_EMPTY
+        assert reader.generation == 0
+
+        writer.publish(REG_TABLE[0], (21.5,))
+        writer.publish(REG_TABLE[2], (1, 2, 3))
+        sample = reader.read("TEMP")
+        assert (sample.value, sample.status) == (21.5, STATUS_OK)
+        assert sample.timestamp > 0
+        assert reader.generation == 2
+
+        writer.publish(REG_TABLE[2], None)
+        samples = reader.read_all()
+        assert [samples[f"圧力センサー[{i}]"].value for i in range(3)] == [1, 2, 3]
+        assert {samples[f"圧力センサー[{i}]"].status for i in range(3)} == {STATUS_NO_RESPONSE}
+
+
+def test_seqlock_slots_are_even_after_publish(writer, block_name):
+    writer.publish(REG_TABLE[0], (1.0,))
+    with SharedPollImageReader(block_name) as reader:
+        seq = shared_image._SEQ.unpack_from(reader._shm.buf, reader._slot_offset)[0]
+        assert seq % 2 == 0 and seq > 0
+
+
+def test_duplicate_element_names_are_rejected(block_name):
+    table = REG_TABLE + [{"name": "TEMP", "addr": 300, "type": "uint16_t", "length": 1, "access": "R"}]
+    with pytest.raises(ValueError, match="TEMP"):
+        SharedPollImage(table, block_name)
+
+
+def test_block_of_another_live_process_is_not_taken(writer, block_name):
+    buf = writer._shm.buf
+    shared_image._OWNER_PID.pack_into(buf, shared_image._LAYOUT_HEADER_SIZE, os.getppid())
+    try:
+        with pytest.raises(FileExistsError, match="--shm"):
+            SharedPollImage(REG_TABLE, block_name)
+    finally:
+        shared_image._OWNER_PID.pack_into(buf, shared_image._LAYOUT_HEADER_SIZE, os.getpid())
+    writer.publish(REG_TABLE[0], (5.0,))
+    with SharedPollImageReader(block_name) as reader:
+        assert reader.read("TEMP").value == 5.0
+
+
+def test_stale_block_with_same_layout_is_adopted_in_place(block_name):
+    leave_stale_block(block_name)
+    with SharedPollImageReader(block_name) as reader:
+        assert reader.read("TEMP").value == 21.5
+        image = SharedPollImage(REG_TABLE, block_name)
+        try:
+            assert reader.read("TEMP").status == STATUS_EMPTY
+            image.publish(REG_TABLE[0], (42.0,))
+            assert reader.read("TEMP").value == 42.0
+            assert reader.generation == 2
+        finally:
+            image.close()
+
+
+def test_adopted_block_leaves_resource_tracker_balanced(block_name):
+    leave_stale_block(block_name)
+    result = run_python(f"""
+        from modbus_master_sim.shared_image import SharedPollImage
+        image = SharedPollImage({REG_TABLE!r}, {block_name!r})
+        image.close()
+    """)
+    assert result.returncode == 0, result.stderr
+    assert "leaked" not in result.stderr
+    assert "Traceback" not in result.stderr
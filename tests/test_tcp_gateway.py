@@ -0,0 +1,186 @@
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+from modbus_master_sim.tcp_gateway import ModbusTcpGateway, RegisterCache
+
+
+class FakeBus:
+    """In-memory RTU slave answering through ``done`` callbacks like the send queue."""
+
+    def __init__(self, read_delay=0.0):
+        self.mem = {addr: addr * 3 for addr in range(200)}
+        self.reads = []
+        self.read_delay = read_delay
+
+    def read(self, unit, addr, count, done):
+        self.reads.append((unit, addr, count))
+
+        def reply():
+            time.sleep(self.read_delay)
+            data = b"".join(struct.pack(">H", self.mem[a]) for a in range(addr, addr + count))
+            done(bytes([unit, 0x03, len(data)]) + data + b"\0\0")
+        threading.Thread(target=reply, daemon=True).start()
+
+    def write_single(self, unit, addr, value, done, claim):
+        if not claim():
+            return
+        self.mem[addr] = value
+        done(bytes([unit, 0x06]) + struct.pack(">HH", addr, value) + b"\0\0")
+
+    def write_multi(self, unit, addr, values, done, claim):
+        if not claim():
+            return
+        for i, value in enumerate(values):
+            self.mem[addr + i] = value
+        done(bytes([unit, 0x10]) + struct.pack(">HH", addr, len(values)) + b"\0\0")
+
+
+class QueuedBus(FakeBus):
+    """Holds writes back like a busy send queue until ``run_queued`` is called."""
+
+    def __init__(self, send_time=0.0):
+        super().__init__()
+        self.queued = []
+        self.send_time = send_time
+
+    def write_single(self, *args):
+        self.queued.append(args)
+
+    def run_queued(self):
+        for args in self.queued:
+            *request, done, claim = args
+            FakeBus.write_single(self, *request, lambda resp: (time.sleep(self.send_time), done(resp)), claim)
+        self.queued = []
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def gateway_factory():
+    gateways = []
+
+    def make(bus, max_age=1.0, clock=None, timeout=5.0):
+        cache = RegisterCache(clock=clock) if clock else RegisterCache()
+        gateway = ModbusTcpGateway(
+            cache, bus.read, bus.write_single, bus.write_multi, port=0, max_age=max_age, timeout=timeout
+        )
+        gateway.start()
+        gateways.append(gateway)
+        return gateway
+
+    yield make
+    for gateway in gateways:
+        gateway.stop()
+
+
+def request(gateway, pdu, unit=1, transaction_id=7):
+    with socket.create_connection(gateway.address, timeout=5) as sock:
+        sock.sendall(struct.pack(">HHHB", transaction_id, 0, len(pdu) + 1, unit) + pdu)
+        header = b""
+        while len(header) < 7:
+            header += sock.recv(7 - len(header))
+        tid, _, length, _ = struct.unpack(">HHHB", header)
+        assert tid == transaction_id
+        body = b""
+        while len(body) < length - 1:
+            body += sock.recv(length - 1 - len(body))
+    return body
+
+
+def read_pdu(addr, count):
+    return struct.pack(">BHH", 0x03, addr, count)
+
+
+def test_concurrent_reads_are_coalesced_into_one_bus_read(gateway_factory):
+    bus = FakeBus(read_delay=0.2)
+    gateway = gateway_factory(bus)
+
+    results = [None] * 5
+
+    def client(i):
+        results[i] = request(gateway, read_pdu(10, 4))
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    expected = bytes([0x03, 8]) + struct.pack(">4H", 30, 33, 36, 39)
+    assert results == [expected] * 5
+    assert bus.reads == [(1, 10, 4)]
+    assert gateway.stats["bus_reads"] == 1
+    assert gateway.stats["coalesced"] == 4
+
+
+def test_reads_are_served_from_cache_until_max_age(gateway_factory):
+    bus = FakeBus()
+    clock = FakeClock()
+    gateway = gateway_factory(bus, max_age=1.0, clock=clock)
+    gateway.cache.store(1, 10, struct.pack(">2H", 111, 222))
+
+    clock.now += 0.5
+    assert request(gateway, read_pdu(10, 2)) == bytes([0x03, 4]) + struct.pack(">2H", 111, 222)
+    assert bus.reads == []
+
+    clock.now += 1.0
+    assert request(gateway, read_pdu(10, 2)) == bytes([0x03, 4]) + struct.pack(">2H", 30, 33)
+    assert bus.reads == [(1, 10, 2)]
+
+
+def test_writes_are_forwarded_and_invalidate_cache(gateway_factory):
+    bus = FakeBus()
+    gateway = gateway_factory(bus)
+    request(gateway, read_pdu(10, 2))
+    assert len(bus.reads) == 1
+
+    write = struct.pack(">BHH", 0x06, 11, 999)
+    assert request(gateway, write) == write
+    assert bus.mem[11] == 999
+
+    assert request(gateway, read_pdu(10, 2)) == bytes([0x03, 4]) + struct.pack(">2H", 30, 999)
+    assert len(bus.reads) == 2
+
+    multi = struct.pack(">BHHB2H", 0x10, 20, 2, 4, 5, 6)
+    assert request(gateway, multi) == struct.pack(">BHH", 0x10, 20, 2)
+    assert (bus.mem[20], bus.mem[21]) == (5, 6)
+
+
+def test_unsupported_function_and_bad_count_return_exceptions(gateway_factory):
+    gateway = gateway_factory(FakeBus())
+    assert request(gateway, bytes([0x04, 0, 0, 0, 1])) == bytes([0x84, 0x01])
+    assert request(gateway, read_pdu(0, 0)) == bytes([0x83, 0x03])
+
+
+def test_write_that_times_out_in_the_queue_is_never_sent(gateway_factory):
+    bus = QueuedBus()
+    gateway = gateway_factory(bus, timeout=0.1)
+    assert request(gateway, struct.pack(">BHH", 0x06, 11, 999)) == bytes([0x86, 0x0B])
+
+    bus.run_queued()  # the worker reaches the write only after the client gave up
+    assert bus.mem[11] == 33
+
+
+def test_write_already_on_the_bus_waits_for_its_result(gateway_factory):
+    bus = QueuedBus(send_time=0.15)
+    gateway = gateway_factory(bus, timeout=0.1)
+    write = struct.pack(">BHH", 0x06, 11, 999)
+    results = []
+    client = threading.Thread(target=lambda: results.append(request(gateway, write)))
+    client.start()
+    while not bus.queued:
+        time.sleep(0.01)
+    bus.run_queued()  # claimed before the timeout, answered after it
+    client.join()
+    assert results == [write]
+    assert bus.mem[11] == 999